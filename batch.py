@@ -0,0 +1,78 @@
+import os
+import time
+import numpy as np
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from grid import Grid, Engine
+from grid_graph import GridGraph, Backend
+
+
+@dataclass
+class GraphInstance:
+    index: int
+    seed: int
+    grid: np.ndarray
+    warehouses: np.ndarray
+    nodes: np.ndarray
+    node_types: np.ndarray
+    node_ids: np.ndarray
+    edges: np.ndarray
+    generate_seconds: float
+    build_seconds: float
+
+
+def instance_seeds(base_seed: int, count: int) -> list[int]:
+    """Independent per-instance seeds derived from a base seed, the same whatever the worker count."""
+    children = np.random.SeedSequence(base_seed).spawn(count)
+    return [int(child.generate_state(1, dtype=np.uint32)[0]) for child in children]
+
+
+def generate_instance(index: int, seed: int, width: int, height: int, **grid_kwargs) -> GraphInstance:
+    """Generate one grid and its graph with the fast engines."""
+    start = time.perf_counter()
+    grid = Grid(width, height, seed=seed, engine=Engine.FAST, **grid_kwargs)
+    generated = time.perf_counter()
+    arrays = GridGraph(grid, engine=Engine.FAST, backend=Backend.ARRAYS).to_arrays()
+    built = time.perf_counter()
+    return GraphInstance(
+        index=index,
+        seed=seed,
+        grid=grid.grid,
+        warehouses=np.array(sorted(grid.warehouses), dtype=np.int32),
+        generate_seconds=generated - start,
+        build_seconds=built - generated,
+        **arrays,
+    )
+
+
+def _generate_chunk(chunk, width, height, grid_kwargs):
+    return [generate_instance(index, seed, width, height, **grid_kwargs) for index, seed in chunk]
+
+
+def generate_batch(count: int, width: int, height: int, seed: int = 0, workers: int | None = None,
+                   chunk_size: int | None = None, **grid_kwargs):
+    """Yield `count` GraphInstances in index order, generated over a process pool.
+
+    Instance i always uses instance_seeds(seed, count)[i], so the output for a base seed does
+    not depend on `workers`. Instances are sent back in chunks to keep pickling overhead low.
+    """
+    workers = workers or os.cpu_count() or 1
+    jobs = list(enumerate(instance_seeds(seed, count)))
+
+    if workers == 1:
+        for index, instance_seed in jobs:
+            yield generate_instance(index, instance_seed, width, height, **grid_kwargs)
+        return
+
+    chunk_size = chunk_size or max(1, min(64, count // (workers * 4)))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_generate_chunk, chunk, width, height, grid_kwargs) for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+
+def save_instance(instance: GraphInstance, directory: str) -> str:
+    path = os.path.join(directory, f"instance_{instance.index:06d}.npz")
+    np.savez(path, **vars(instance))
+    return path
@@ -0,0 +1,254 @@
+"""Per-phase benchmark of Grid generation, GridGraph.create_graph and the renderers.
+
+Generation and graph building are timed through the public constructors and split into
+sub-phases (e.g. build.corners, build.road_edges) by their instrument=True stats. Every phase is
+timed over a range of grid sizes with fixed seeds, keeping the fastest of --repeats runs, reporting wall time, peak traced memory and
+node/edge counts, and a scaling exponent (time ~ cells^k) is fitted per phase. Results can be written to JSON and compared against an earlier run:
+
+    python benchmarks/phases.py --output new.json --compare old.json
+
+The comparison exits with status 1 if any phase got slower than --threshold times the baseline and
+by more than --min-gap seconds.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from grid import Grid, Engine  # noqa: E402
+from grid_graph import GridGraph, Backend  # noqa: E402
+
+# A slowdown smaller than this is within timing noise, whatever its ratio.
+MIN_GAP_SECONDS = 0.01
+
+
+class _Phase:
+    """Times a block and, when memory tracing is on, records its peak allocation."""
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.seconds = None
+        self.peak_bytes = None
+
+    @classmethod
+    def recorded(cls, seconds: float) -> "_Phase":
+        """A phase timed elsewhere."""
+        phase = cls(False)
+        phase.seconds = seconds
+        return phase
+
+    def __enter__(self):
+        if self.trace:
+            tracemalloc.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self._start
+        if self.trace:
+            _, self.peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+
+def _run_phases(size: int, seed: int, engine: Engine, backend: Backend, trace: bool, render_max: int, plot_max: int,
+                workdir: str) -> dict[str, _Phase]:
+    """Run every phase once on a size x size grid and return them by name."""
+    phases = {}
+    with _Phase(trace) as phases["generate"]:
+        grid = Grid(size, size, seed=seed, engine=engine, instrument=True)
+    with _Phase(trace) as phases["build"]:
+        graph = GridGraph(grid, engine=engine, backend=backend, instrument=True)
+    phases["generate"].counts = {"buildings": grid.stats.counts["buildings"], "warehouses": grid.stats.counts["warehouses"]}
+    phases["build"].counts = {"nodes": graph.stats.counts["nodes"], "edges": graph.stats.counts["edges"]}
+    # Sub-phases come from the instrumentation inside Grid and create_graph, so they follow the
+    # real pipeline. They are only timed; the peak memory is measured for whole phases.
+    for parent, stats in (("generate", grid.stats), ("build", graph.stats)):
+        for name, seconds in stats.timings.items():
+            if name != "total":
+                phases[f"{parent}.{name}"] = _Phase.recorded(seconds)
+
+    if size <= render_max:
+        with _Phase(trace) as phases["render_raster"]:
+            grid.visualize_grid(os.path.join(workdir, "grid_raster.png"), pixels_per_cell=4)
+    if size <= plot_max:
+        with _Phase(trace) as phases["render_matplotlib"]:
+            grid.visualize_grid(os.path.join(workdir, "grid_plot.png"))
+        if shutil.which("dot") is not None:
+            cwd = os.getcwd()
+            os.chdir(workdir)
+            try:
+                with _Phase(trace) as phases["render_graphviz"]:
+                    graph.output_graphviz()
+            finally:
+                os.chdir(cwd)
+    return phases
+
+
+def _fastest(runs: list[dict[str, _Phase]]) -> dict[str, _Phase]:
+    """Per phase, the run with the lowest time; the minimum is the estimate least affected by other load."""
+    return {name: min((phases[name] for phases in runs if name in phases), key=lambda phase: phase.seconds)
+            for name in runs[0]}
+
+
+def run(sizes: list[int], seeds: list[int], engines: list[Engine], backend: Backend, reference_max: int, render_max: int,
+        plot_max: int, memory: bool, repeats: int = 1, log=print) -> list[dict]:
+    """One record per (engine, size, seed, phase), timed as the fastest of `repeats` runs."""
+    records = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine in engines:
+            # A discarded warm-up run, so lazy imports and first-call costs don't land in the smallest size.
+            _run_phases(min(sizes), seeds[0], engine, backend, False, render_max, plot_max, workdir)
+            for size in sizes:
+                if engine == Engine.REFERENCE and size > reference_max:
+                    continue
+                for seed in seeds:
+                    try:
+                        timed = _fastest([_run_phases(size, seed, engine, backend, False, render_max, plot_max, workdir)
+                                          for _ in range(repeats)])
+                        traced = _run_phases(size, seed, engine, backend, True, render_max, plot_max, workdir) if memory else {}
+                    except ValueError as error:
+                        # The reference generator can fail on some seeds; skip them rather than abort the run.
+                        log(f"{engine:9s} {size:6d} seed {seed}: skipped ({error})")
+                        continue
+                    for name, phase in timed.items():
+                        records.append({
+                            "engine": str(engine),
+                            "size": size,
+                            "cells": size * size,
+                            "seed": seed,
+                            "phase": name,
+                            "seconds": phase.seconds,
+                            "peak_bytes": traced[name].peak_bytes if name in traced else None,
+                            **getattr(phase, "counts", {}),
+                        })
+                    total = sum(phase.seconds for name, phase in timed.items() if "." not in name)
+                    log(f"{engine:9s} {size:6d} seed {seed}: {total:8.3f} s")
+    return records
+
+
+def summarize(records: list[dict]) -> dict:
+    """Median time and peak memory per engine, phase and size."""
+    grouped = {}
+    for record in records:
+        grouped.setdefault((record["engine"], record["phase"], record["size"]), []).append(record)
+    summary = {}
+    for (engine, phase, size), group in grouped.items():
+        peaks = [record["peak_bytes"] for record in group if record["peak_bytes"] is not None]
+        entry = {
+            "median_seconds": statistics.median(record["seconds"] for record in group),
+            "median_peak_bytes": statistics.median(peaks) if peaks else None,
+        }
+        for count in ("buildings", "nodes", "edges"):
+            if count in group[0]:
+                entry[count] = statistics.median(record[count] for record in group)
+        summary.setdefault(engine, {}).setdefault(phase, {})[str(size)] = entry
+    return summary
+
+
+def scaling_exponents(summary: dict) -> dict:
+    """Least-squares slope of log(time) against log(cells), ignoring sizes too fast to time reliably."""
+    exponents = {}
+    for engine, phases in summary.items():
+        for phase, sizes in phases.items():
+            points = [(int(size) ** 2, entry["median_seconds"]) for size, entry in sizes.items()
+                      if entry["median_seconds"] >= 1e-4]
+            if len(points) >= 3:
+                cells, seconds = np.log(np.array(points, dtype=float)).T
+                exponents.setdefault(engine, {})[phase] = round(float(np.polyfit(cells, seconds, 1)[0]), 3)
+    return exponents
+
+
+def compare(summary: dict, baseline: dict, threshold: float, min_gap: float = MIN_GAP_SECONDS) -> list[str]:
+    """Phases that are more than `threshold` times and more than `min_gap` seconds slower than in the baseline."""
+    regressions = []
+    for engine, phases in summary.items():
+        for phase, sizes in phases.items():
+            for size, entry in sizes.items():
+                before = baseline.get(engine, {}).get(phase, {}).get(size)
+                if before is None or before["median_seconds"] <= 0:
+                    continue
+                ratio = entry["median_seconds"] / before["median_seconds"]
+                if ratio > threshold and entry["median_seconds"] - before["median_seconds"] > min_gap:
+                    regressions.append(f"{engine} {phase} size {size}: {before['median_seconds']:.4f} s -> "
+                                       f"{entry['median_seconds']:.4f} s ({ratio:.2f}x)")
+    return regressions
+
+
+def _revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_table(summary: dict, exponents: dict):
+    for engine, phases in summary.items():
+        print(f"\n{engine}")
+        for phase, sizes in phases.items():
+            cells = "  ".join(f"{size}:{entry['median_seconds'] * 1000:.1f}ms" for size, entry in sizes.items())
+            exponent = exponents.get(engine, {}).get(phase)
+            print(f"  {phase:26s} k={exponent if exponent is not None else '-':<6} {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 25, 50, 100, 200, 500, 1000, 2000])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    parser.add_argument("--engines", nargs="+", choices=[engine.value for engine in Engine], default=[Engine.FAST.value])
+    parser.add_argument("--backend", choices=[backend.value for backend in Backend], default=Backend.NETWORKX.value)
+    parser.add_argument("--reference-max", type=int, default=100, help="largest size run with the reference engine")
+    parser.add_argument("--render-max", type=int, default=1000, help="largest size rendered as a raster")
+    parser.add_argument("--plot-max", type=int, default=25, help="largest size rendered with matplotlib and graphviz")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per size and seed; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced pass that measures peak memory")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.5, help="slowdown ratio reported as a regression")
+    parser.add_argument("--min-gap", type=float, default=MIN_GAP_SECONDS,
+                        help="smallest slowdown in seconds reported as a regression")
+    args = parser.parse_args()
+
+    records = run(args.sizes, args.seeds, [Engine(engine) for engine in args.engines], Backend(args.backend),
+                  args.reference_max, args.render_max, args.plot_max, not args.no_memory,
+                  args.repeats)
+    summary = summarize(records)
+    exponents = scaling_exponents(summary)
+    _print_table(summary, exponents)
+
+    if args.output:
+        results = {
+            "revision": _revision(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "arguments": vars(args),
+            "records": records,
+            "summary": summary,
+            "exponents": exponents,
+        }
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(summary, json.load(file)["summary"], args.threshold, args.min_gap)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
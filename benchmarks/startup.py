@@ -0,0 +1,81 @@
+"""Cold-start benchmark for importing grid_graph and for a headless generate-and-build run.
+
+Every sample runs in a fresh interpreter, so it includes the full import cost. Exits with
+status 1 if a median exceeds its budget or a headless run loads a plotting library.
+
+    python benchmarks/startup.py [--runs N] [--import-budget-ms MS] [--headless-budget-ms MS] [--json PATH]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("matplotlib", "graphviz", "PIL", "pygraphviz", "networkx")
+
+SCENARIOS = {
+    "import": "import grid_graph",
+    "headless": (
+        "from grid import Grid, Engine\n"
+        "from grid_graph import GridGraph, Backend\n"
+        "GridGraph(Grid(100, 100, seed=0, engine=Engine.FAST), backend=Backend.ARRAYS).to_arrays()"
+    ),
+}
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+exec({code!r})
+elapsed = time.perf_counter() - start
+print(elapsed, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def run_once(code: str) -> tuple[float, list[str]]:
+    """Wall time of `code` in a fresh interpreter (interpreter start-up excluded) and the heavy modules it loaded."""
+    probe = PROBE.format(code=code, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, check=True, capture_output=True, text=True).stdout.split()
+    return float(output[0]), output[1].split(",") if len(output) > 1 else []
+
+
+def measure(runs: int) -> dict:
+    results = {}
+    for name, code in SCENARIOS.items():
+        samples, loaded = [], set()
+        for _ in range(runs):
+            seconds, modules = run_once(code)
+            samples.append(seconds * 1000)
+            loaded.update(modules)
+        results[name] = {"median_ms": statistics.median(samples), "min_ms": min(samples), "samples_ms": samples, "loaded": sorted(loaded)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--import-budget-ms", type=float, default=300.0)
+    parser.add_argument("--headless-budget-ms", type=float, default=1000.0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    budgets = {"import": args.import_budget_ms, "headless": args.headless_budget_ms}
+    failed = False
+    for name, result in results.items():
+        over_budget = result["median_ms"] > budgets[name]
+        plotting = [module for module in result["loaded"] if module != "networkx"]
+        failed |= over_budget or bool(plotting)
+        print(f"{name:9s} median {result['median_ms']:8.1f} ms  min {result['min_ms']:8.1f} ms  budget {budgets[name]:.0f} ms"
+              f"  loaded: {', '.join(result['loaded']) or '-'}{'  OVER BUDGET' if over_budget else ''}")
+        result["budget_ms"] = budgets[name]
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
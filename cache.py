@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from grid import Grid, Engine
+from grid_graph import GridGraph, Backend
+
+
+class GridCache:
+    """Content-addressed on-disk cache of generated grids and their graphs.
+
+    Entries are keyed by the generation parameters and seed, so a repeated request only opens
+    (and memory-maps) the saved files instead of generating the layout and graph again.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(width: int, height: int, seed: int, max_road_width: int = 2, min_building_size: int = 2, max_building_size: int = 6,
+            engine: Engine = Engine.FAST, tile_size: int | None = None) -> str:
+        params = {
+            "width": width,
+            "height": height,
+            "seed": seed,
+            "max_road_width": max_road_width,
+            "min_building_size": min_building_size,
+            "max_building_size": max_building_size,
+            "engine": str(Engine(engine)),
+            "tile_size": tile_size,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def path(self, *args, **kwargs) -> str:
+        return os.path.join(self._directory, self.key(*args, **kwargs))
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isdir(os.path.join(self._directory, key))
+
+    def get(self, width: int, height: int, seed: int, max_road_width: int = 2, min_building_size: int = 2, max_building_size: int = 6,
+            engine: Engine = Engine.FAST, tile_size: int | None = None) -> tuple[Grid, GridGraph]:
+        """The grid and graph for these parameters, generated and stored on the first request."""
+        if seed is None:
+            raise ValueError("Only seeded grids can be cached.")
+        params = dict(max_road_width=max_road_width, min_building_size=min_building_size, max_building_size=max_building_size,
+                      engine=engine, tile_size=tile_size)
+        entry = self.path(width, height, seed, **params)
+
+        if not os.path.isdir(entry):
+            # Build in a staging directory and rename it into place, so readers never see a
+            # half-written entry and concurrent builders of the same key do not clash.
+            staging = tempfile.mkdtemp(dir=self._directory, prefix=".staging-")
+            try:
+                cells_path = os.path.join(staging, "cells.npy") if tile_size is not None else None
+                grid = Grid(width, height, seed=seed, path=cells_path, **params)
+                grid.save(os.path.join(staging, "grid"))
+                GridGraph(grid, backend=Backend.ARRAYS).save(os.path.join(staging, "graph"))
+                del grid
+                if cells_path is not None:
+                    os.remove(cells_path)
+                os.rename(staging, entry)
+            except OSError:
+                if not os.path.isdir(entry):
+                    raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        grid = Grid.load(os.path.join(entry, "grid"))
+        return grid, GridGraph.load(os.path.join(entry, "graph"), grid)
@@ -0,0 +1,140 @@
+import os
+import shutil
+import subprocess
+from contextlib import contextmanager
+import numpy as np
+from grid_graph import GridGraph, CompactGraph, NodeType
+
+# Same look as the original graphviz.Digraph output.
+NODE_COLORS = {
+    NodeType.INTERSECTION: 'dodgerblue',
+    NodeType.ROAD_END: 'green3',
+    NodeType.BUILDING: 'gold',
+    NodeType.WAREHOUSE: 'firebrick1',
+}
+NODE_SHAPES = {
+    NodeType.INTERSECTION: 'octagon',
+    NodeType.ROAD_END: 'square',
+    NodeType.BUILDING: 'house',
+    NodeType.WAREHOUSE: 'invhouse',
+}
+# Graphs larger than this are written but not laid out: dot's layout is superlinear.
+MAX_RENDER_NODES = 2000
+
+CHUNK_SIZE = 65536
+
+
+@contextmanager
+def _opened(target, mode):
+    """A file opened from a path, or a file-like object passed through untouched."""
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, mode) as file:
+            yield file
+    else:
+        yield target
+
+
+def _compact_graph(graph: GridGraph | CompactGraph) -> CompactGraph:
+    """The CompactGraph to write; a networkx-backed GridGraph is converted, so pass the result to several writers."""
+    return graph if isinstance(graph, CompactGraph) else graph.get_compact_graph()
+
+
+def _node_chunks(compact: CompactGraph, chunk_size: int):
+    """(first index, bounding boxes, type codes, building IDs) for consecutive runs of nodes."""
+    for start in range(0, compact.number_of_nodes(), chunk_size):
+        end = start + chunk_size
+        yield start, compact.bounding_boxes[start:end].tolist(), compact.node_types[start:end].tolist(), compact.node_ids[start:end].tolist()
+
+
+def _edge_chunks(compact: CompactGraph, chunk_size: int):
+    """(sources, targets, weights) arrays, one entry per undirected edge, a run of source nodes at a time."""
+    indptr = compact.indptr
+    for start in range(0, compact.number_of_nodes(), chunk_size):
+        end = min(start + chunk_size, compact.number_of_nodes())
+        low, high = indptr[start], indptr[end]
+        sources = np.repeat(np.arange(start, end, dtype=np.int32), np.diff(indptr[start:end + 1]))
+        targets = compact.indices[low:high]
+        upper = sources <= targets
+        yield sources[upper], targets[upper], compact.weights[low:high][upper]
+
+
+def write_dot(graph: GridGraph | CompactGraph, target, chunk_size: int = CHUNK_SIZE):
+    """Write the graph as Graphviz DOT, styled like output_graphviz, to a path or text file object."""
+    compact = _compact_graph(graph)
+    node_types = list(NodeType)
+    with _opened(target, "w") as file:
+        file.write("graph {\n\tnode [style=filled]\n")
+        for start, boxes, codes, ids in _node_chunks(compact, chunk_size):
+            lines = []
+            for i, (box, code, id) in enumerate(zip(boxes, codes, ids), start):
+                node_type = node_types[code]
+                name = f"{node_type}({id})" if id >= 0 else f"{node_type}"
+                lines.append(f'\t{i} [label="{name}\\n{tuple(box)}" shape={NODE_SHAPES[node_type]} fillcolor={NODE_COLORS[node_type]}]\n')
+            file.write("".join(lines))
+        for sources, targets, weights in _edge_chunks(compact, chunk_size):
+            file.write("".join(f'\t{u} -- {v} [label={w} penwidth={w}]\n'
+                               for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist())))
+        file.write("}\n")
+
+
+def write_graphml(graph: GridGraph | CompactGraph, target, chunk_size: int = CHUNK_SIZE):
+    """Write the graph as GraphML, with type, building ID, bounding box and weight attributes."""
+    compact = _compact_graph(graph)
+    node_types = list(NodeType)
+    with _opened(target, "w") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+                   '  <key id="type" for="node" attr.name="type" attr.type="string"/>\n'
+                   '  <key id="id" for="node" attr.name="id" attr.type="int"/>\n'
+                   '  <key id="bbox" for="node" attr.name="bounding_box" attr.type="string"/>\n'
+                   '  <key id="weight" for="edge" attr.name="weight" attr.type="int"/>\n'
+                   '  <graph id="grid_graph" edgedefault="undirected">\n')
+        for start, boxes, codes, ids in _node_chunks(compact, chunk_size):
+            file.write("".join(
+                f'    <node id="n{i}"><data key="type">{node_types[code]}</data>'
+                + (f'<data key="id">{id}</data>' if id >= 0 else '')
+                + f'<data key="bbox">{" ".join(map(str, box))}</data></node>\n'
+                for i, (box, code, id) in enumerate(zip(boxes, codes, ids), start)
+            ))
+        for sources, targets, weights in _edge_chunks(compact, chunk_size):
+            file.write("".join(f'    <edge source="n{u}" target="n{v}"><data key="weight">{w}</data></edge>\n'
+                               for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist())))
+        file.write('  </graph>\n</graphml>\n')
+
+
+def write_edge_list(graph: GridGraph | CompactGraph, target, binary: bool = False, chunk_size: int = CHUNK_SIZE):
+    """Write (source, target, weight) rows with node indices in CompactGraph order.
+
+    As CSV with a header line, or with binary=True as an (E, 3) int32 .npy array, which np.load
+    can read back or memory-map.
+    """
+    compact = _compact_graph(graph)
+    if not binary:
+        with _opened(target, "w") as file:
+            file.write("source,target,weight\n")
+            for sources, targets, weights in _edge_chunks(compact, chunk_size):
+                file.write("".join(f"{u},{v},{w}\n" for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist())))
+        return
+
+    # A first pass counts the edges for the header, so the rows can be streamed after it.
+    edge_count = sum(len(sources) for sources, _, _ in _edge_chunks(compact, chunk_size))
+    with _opened(target, "wb") as file:
+        header = {"descr": np.lib.format.dtype_to_descr(np.dtype(np.int32)), "fortran_order": False, "shape": (edge_count, 3)}
+        np.lib.format.write_array_header_1_0(file, header)
+        for sources, targets, weights in _edge_chunks(compact, chunk_size):
+            file.write(np.stack([sources, targets, weights], axis=1).astype(np.int32).tobytes())
+
+
+def render_dot(dot_path: str, output_path: str, format: str = "png", node_count: int | None = None,
+               max_nodes: int = MAX_RENDER_NODES) -> bool:
+    """Lay out and render a DOT file with the `dot` program.
+
+    Returns False without running it when node_count is over max_nodes, since the layout time
+    grows faster than the graph; raises if `dot` is not installed.
+    """
+    if node_count is not None and node_count > max_nodes:
+        return False
+    if shutil.which("dot") is None:
+        raise FileNotFoundError("The Graphviz `dot` program is needed to render graphs.")
+    subprocess.run(["dot", f"-T{format}", dot_path, "-o", output_path], check=True)
+    return True
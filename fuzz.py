@@ -0,0 +1,367 @@
+"""Differential fuzzing of the optimized generation and graph-building paths against the baseline.
+
+    python fuzz.py [--time-budget SECONDS] [--seed N] [--max-size N] [--replay JSON]
+
+The cases in PINNED_CASES are checked first, then random cases (grid size, generation
+parameters and seed) are drawn until the time budget runs out. For each case:
+
+- grids from both generators follow the layout rules: full-length roads, rectangular buildings
+  within the size bounds and touching a road, and 10% of them warehouses. The fast generator
+  uses its own random stream, so its grids are checked against the rules, not cell by cell.
+- the graph of each grid is built with the frozen original code in baseline_graph.py and
+  compared with the reference and fast engines, tiled building and the arrays backend: same
+  nodes with the same type and building ID, and the same edges with the same weights (and
+  the same order for the networkx graphs). The in-tree reference engine is checked like the
+  others, so a change made to both engines can't hide.
+- contraction hierarchy distances and paths between random nodes match plain Dijkstra.
+- random place_building, remove_building and update_warehouses steps leave the graph equal
+  to a full rebuild (diff_against_rebuild) after each step.
+- every grid, saved and loaded back, resets to the same layout as the original.
+
+A failing case is shrunk to a smaller size, simpler parameters and a lower seed that still fail,
+printed as JSON for --replay, and the script exits with status 1.
+"""
+import argparse
+import copy
+import itertools
+import json
+import random
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict, replace
+import networkx as nx
+import numpy as np
+from grid import Grid, Engine, CellType
+from grid_graph import GridGraph, Backend
+import baseline_graph
+from hierarchy import ContractionHierarchy
+from routing import shortest_paths
+
+
+@dataclass(frozen=True)
+class Case:
+    width: int
+    height: int
+    max_road_width: int
+    min_building_size: int
+    max_building_size: int
+    seed: int
+    tile_size: int
+
+    def grid(self, engine: Engine, tiled: bool = False) -> Grid:
+        return Grid(self.width, self.height, self.max_road_width, self.min_building_size, self.max_building_size,
+                    seed=self.seed, engine=engine, tile_size=self.tile_size if tiled else None)
+
+
+# Checked before the random cases: non-square grids with wide roads, where overlapping
+# intersections make the edges depend on the order the baseline adds intersection nodes.
+PINNED_CASES = [
+    Case(width=10, height=9, max_road_width=4, min_building_size=1, max_building_size=2, seed=65066, tile_size=35),
+    Case(width=26, height=35, max_road_width=4, min_building_size=2, max_building_size=5, seed=47393, tile_size=20),
+    Case(width=16, height=34, max_road_width=3, min_building_size=1, max_building_size=5, seed=36416, tile_size=9),
+    Case(width=7, height=19, max_road_width=4, min_building_size=3, max_building_size=5, seed=19215, tile_size=35),
+]
+
+
+def random_case(rng: random.Random, max_size: int) -> Case:
+    min_building_size = rng.randint(1, 3)
+    return Case(
+        width=rng.randint(6, max_size),
+        height=rng.randint(6, max_size),
+        max_road_width=rng.choice([1, 2, 2, 3, 4]),
+        min_building_size=min_building_size,
+        max_building_size=min_building_size + rng.randint(0, 4),
+        seed=rng.randrange(1 << 16),
+        tile_size=rng.randint(1, max_size),
+    )
+
+
+def _layout_errors(grid: Grid, case: Case, tiled: bool) -> list[str]:
+    """Ways in which a generated grid breaks the layout rules."""
+    cells = np.asarray(grid.grid)
+    road = cells == CellType.ROAD
+    errors = []
+    road_rows, road_columns = road.all(axis=1), road.all(axis=0)
+    if (road & ~road_rows[:, None] & ~road_columns[None, :]).any():
+        errors.append("a road cell is not on a full-length road")
+    if (cells == CellType.EMPTY).sum() + road.sum() + (cells > 0).sum() != cells.size:
+        errors.append("a cell has an unknown value")
+
+    building_ids = np.unique(cells[cells > 0])
+    if building_ids.tolist() != list(range(1, grid.next_building_id)):
+        errors.append(f"building IDs are not 1..{grid.next_building_id - 1}")
+    for id in building_ids.tolist():
+        ys, xs = np.nonzero(cells == id)
+        top, bottom, left, right = ys.min(), ys.max(), xs.min(), xs.max()
+        height, width = bottom - top + 1, right - left + 1
+        if len(ys) != height * width:
+            errors.append(f"building {id} is not a rectangle")
+        if not all(case.min_building_size <= size <= case.max_building_size for size in (height, width)):
+            errors.append(f"building {id} is {width}x{height}")
+        if not road[max(top - 1, 0):bottom + 2, max(left - 1, 0):right + 2].any():
+            errors.append(f"building {id} does not touch a road")
+        if tiled and (top // case.tile_size != bottom // case.tile_size or left // case.tile_size != right // case.tile_size):
+            errors.append(f"building {id} crosses a tile border")
+
+    if len(grid.warehouses) != int(np.ceil(0.1 * (grid.next_building_id - 1))) or not grid.warehouses <= set(building_ids.tolist()):
+        errors.append("wrong warehouses")
+    return errors
+
+
+def _canonical(graph: nx.Graph) -> tuple[dict, dict]:
+    """{bounding box: (type, building ID)} and {(box, box): weight}, independent of node order."""
+    nodes = {node: (str(data['type']), data.get('id', -1)) for node, data in graph.nodes(data=True)}
+    edges = {tuple(sorted((u, v))): data.get('weight', 1) for u, v, data in graph.edges(data=True)}
+    return nodes, edges
+
+
+def _ordered(graph: nx.Graph) -> tuple[list, list]:
+    """Nodes and edges with their data, in graph order, with types as plain strings."""
+    nodes = [(node, str(data['type']), data.get('id', -1)) for node, data in graph.nodes(data=True)]
+    edges = [(u, v, data.get('weight', 1)) for u, v, data in graph.edges(data=True)]
+    return nodes, edges
+
+
+def _diff(expected: dict, actual: dict, what: str) -> str | None:
+    if expected == actual:
+        return None
+    missing = [key for key in expected if key not in actual]
+    extra = [key for key in actual if key not in expected]
+    changed = [key for key in expected if key in actual and expected[key] != actual[key]]
+    for keys, problem in ((missing, "missing"), (extra, "unexpected"), (changed, "different")):
+        if keys:
+            key = keys[0]
+            return f"{len(keys)} {problem} {what}, e.g. {key}: {expected.get(key)} != {actual.get(key)}"
+    return f"{what} differ"
+
+
+def _graph_errors(grid: Grid, case: Case) -> list[str]:
+    """Differences between the baseline graph of a grid and every engine's way of building it."""
+    # GridGraph builds a tiled grid tile by tile, which the reference engine can't do, so the
+    # other builds get an untiled view of the same cells.
+    untiled = copy.copy(grid)
+    untiled.tile_size = None
+    try:
+        baseline = baseline_graph.GridGraph(untiled).get_graph()
+    except Exception as error:
+        baseline, baseline_error = None, type(error)
+    builds = {
+        "reference": lambda: GridGraph(untiled, engine=Engine.REFERENCE),
+        "fast": lambda: GridGraph(untiled, engine=Engine.FAST),
+        f"tiled({case.tile_size})": lambda: GridGraph(grid, engine=Engine.FAST, tile_size=case.tile_size),
+        "arrays": lambda: GridGraph(untiled, engine=Engine.FAST, backend=Backend.ARRAYS),
+    }
+
+    errors = []
+    expected = _canonical(baseline) if baseline is not None else None
+    for name, build in builds.items():
+        try:
+            graph = build().get_graph()
+        except Exception as error:
+            if baseline is None and type(error) is baseline_error:
+                continue
+            errors.append(f"{name}: raised {type(error).__name__}: {error}")
+            continue
+        if baseline is None:
+            errors.append(f"{name}: built a graph where the baseline raised {baseline_error.__name__}")
+            continue
+        nodes, edges = _canonical(graph)
+        build_errors = [error for error in (_diff(expected[0], nodes, "nodes"), _diff(expected[1], edges, "edges")) if error]
+        # The networkx engines also add nodes and edges in the baseline's order.
+        if name in ("reference", "fast") and not build_errors and _ordered(graph) != _ordered(baseline):
+            build_errors.append("same graph but a different node or edge order")
+        errors.extend(f"{name}: {error}" for error in build_errors)
+    return errors
+
+
+def _hierarchy_errors(grid: Grid, case: Case) -> list[str]:
+    """Contraction hierarchy distances and paths against plain Dijkstra, between random node pairs."""
+    try:
+        graph = GridGraph(grid, backend=Backend.ARRAYS)
+    except Exception:
+        # Already reported by the graph comparison.
+        return []
+    compact = graph.get_compact_graph()
+    node_count = compact.number_of_nodes()
+    if not node_count:
+        return []
+    hierarchy = ContractionHierarchy.build(graph)
+    indptr, indices, weights = compact.indptr.tolist(), compact.indices.tolist(), compact.weights.tolist()
+    edge_weight = {}
+    for u in range(node_count):
+        for i in range(indptr[u], indptr[u + 1]):
+            edge_weight[u, indices[i]] = min(weights[i], edge_weight.get((u, indices[i]), weights[i]))
+
+    rng = random.Random(case.seed)
+    errors = []
+    for source in rng.sample(range(node_count), min(node_count, 3)):
+        distance, _ = shortest_paths(indptr, indices, weights, source)
+        reachable = [v for v in range(node_count) if distance[v] < float("inf")]
+        for target in [rng.randrange(node_count) for _ in range(10)] + [rng.choice(reachable) for _ in range(10)]:
+            found = hierarchy.node_distance(source, target)
+            path = hierarchy.node_path(source, target)
+            steps = [edge_weight.get(step) for step in zip(path, path[1:])]
+            if found != distance[target]:
+                errors.append(f"hierarchy: distance {source} -> {target} is {found}, Dijkstra gives {distance[target]}")
+            elif not path:
+                if found != float("inf"):
+                    errors.append(f"hierarchy: no path {source} -> {target} at distance {found}")
+            elif (path[0], path[-1]) != (source, target) or None in steps or sum(steps) != found:
+                errors.append(f"hierarchy: path {source} -> {target} is not a path of length {found}")
+    return errors
+
+
+def _incremental_errors(grid: Grid, case: Case, steps: int = 8) -> list[str]:
+    """Random place_building, remove_building and update_warehouses steps, each checked against a full rebuild."""
+    untiled = copy.deepcopy(grid)
+    untiled.tile_size = None
+    try:
+        graph = GridGraph(untiled)
+    except Exception:
+        # Already reported by the graph comparison.
+        return []
+    rng = random.Random(case.seed)
+    for _ in range(steps):
+        cells = np.asarray(untiled.grid)
+        building_ids = np.unique(cells[cells > 0]).tolist()
+        empty_ys, empty_xs = np.nonzero(cells == CellType.EMPTY)
+        actions = (["place"] if len(empty_ys) else []) + (["remove", "warehouses"] if building_ids else [])
+        if not actions:
+            break
+        action = rng.choice(actions)
+        if action == "place":
+            # From a random empty cell, shrunk until it fits, so most placements succeed.
+            cell = rng.randrange(len(empty_ys))
+            x, y = int(empty_xs[cell]), int(empty_ys[cell])
+            width = rng.randint(case.min_building_size, case.max_building_size)
+            height = rng.randint(case.min_building_size, case.max_building_size)
+            warehouse = rng.random() < 0.2
+            while graph.place_building(x, y, width, height, warehouse=warehouse) is None:
+                width, height = max(width - 1, 1), max(height - 1, 1)
+            step = f"place_building({x}, {y}, {width}, {height}, warehouse={warehouse})"
+        elif action == "remove":
+            building_id = rng.choice(building_ids)
+            step = f"remove_building({building_id})"
+            graph.remove_building(building_id)
+        else:
+            building_id = rng.choice(building_ids)
+            step = f"update_warehouses() after toggling {building_id}"
+            untiled.warehouses ^= {building_id}
+            graph.update_warehouses()
+        if not graph.diff_against_rebuild().is_empty():
+            return [f"incremental: {step} differs from a rebuild"]
+    return []
+
+
+def _reload_errors(grid: Grid) -> list[str]:
+    """A saved and loaded grid continues the random sequence: reset() then gives both the same layout."""
+    with tempfile.TemporaryDirectory() as path:
+        grid.save(path)
+        loaded = Grid.load(path)
+        layouts = []
+        for candidate in (grid, loaded):
+            try:
+                candidate.reset()
+                layouts.append((np.asarray(candidate.grid).tolist(), candidate.warehouses))
+            except ValueError as error:
+                layouts.append(type(error))
+    return [] if layouts[0] == layouts[1] else ["reset() after save() and load() gives a different layout"]
+
+
+def check(case: Case) -> list[str]:
+    """Everything wrong with one case; an empty list when it passes."""
+    errors = []
+    reference_rejected = False
+    for engine, tiled in ((Engine.REFERENCE, False), (Engine.FAST, False), (Engine.FAST, True)):
+        label = "tiled" if tiled else str(engine)
+        try:
+            grid = case.grid(engine, tiled)
+        except ValueError as error:
+            # Only a case the reference generator rejects too may be rejected by the optimized ones.
+            if engine == Engine.REFERENCE:
+                reference_rejected = True
+            elif not reference_rejected:
+                errors.append(f"{label} grid: raised ValueError: {error}")
+            continue
+        errors.extend(f"{label} grid: {error}" for error in _layout_errors(grid, case, tiled))
+        errors.extend(f"{label} grid, graph {error}" for error in _graph_errors(grid, case))
+        errors.extend(f"{label} grid, {error}" for error in _hierarchy_errors(grid, case))
+        errors.extend(f"{label} grid, {error}" for error in _incremental_errors(grid, case))
+        errors.extend(f"{label} grid: {error}" for error in _reload_errors(grid))
+    return errors
+
+
+def _smaller(case: Case):
+    """Simpler variants of a case, most aggressive first."""
+    for field in ("width", "height"):
+        value = getattr(case, field)
+        for smaller in sorted({6, (value + 6) // 2, value - 1}):
+            if 6 <= smaller < value:
+                yield replace(case, **{field: smaller})
+    if case.max_building_size > case.min_building_size:
+        yield replace(case, max_building_size=case.min_building_size)
+        yield replace(case, max_building_size=case.max_building_size - 1)
+    if case.min_building_size > 1:
+        yield replace(case, min_building_size=case.min_building_size - 1)
+    if case.max_road_width > 1:
+        yield replace(case, max_road_width=case.max_road_width - 1)
+    for tile_size in sorted({1, case.tile_size // 2, case.tile_size - 1}):
+        if 1 <= tile_size < case.tile_size:
+            yield replace(case, tile_size=tile_size)
+    for seed in sorted({0, case.seed // 2, *range(min(case.seed, 20))}):
+        if seed < case.seed:
+            yield replace(case, seed=seed)
+
+
+def shrink(case: Case, deadline: float) -> Case:
+    """Greedily replace a failing case with simpler ones that still fail, until none does or time is up."""
+    progress = True
+    while progress and time.monotonic() < deadline:
+        progress = False
+        for candidate in _smaller(case):
+            if time.monotonic() >= deadline:
+                break
+            if check(candidate):
+                case, progress = candidate, True
+                break
+    return case
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--time-budget", type=float, default=60.0, help="seconds to spend generating cases (default 60)")
+    parser.add_argument("--shrink-budget", type=float, default=60.0, help="seconds to spend shrinking a failure (default 60)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the case generator")
+    parser.add_argument("--max-size", type=int, default=60, help="largest grid width or height")
+    parser.add_argument("--replay", help="check a single case, as printed for a failure")
+    args = parser.parse_args()
+
+    if args.replay:
+        cases = iter([Case(**json.loads(args.replay))])
+        deadline = float("inf")
+    else:
+        rng = random.Random(args.seed)
+        cases = itertools.chain(PINNED_CASES, iter(lambda: random_case(rng, max(args.max_size, 6)), None))
+        deadline = time.monotonic() + args.time_budget
+
+    checked = 0
+    for case in cases:
+        errors = check(case)
+        checked += 1
+        if errors:
+            print(f"FAIL {json.dumps(asdict(case))}")
+            print("\n".join(f"  {error}" for error in errors[:10]))
+            minimal = shrink(case, time.monotonic() + args.shrink_budget)
+            if minimal != case:
+                print(f"Shrunk to {json.dumps(asdict(minimal))}")
+                print("\n".join(f"  {error}" for error in check(minimal)[:10]))
+            print(f"Replay with: python fuzz.py --replay '{json.dumps(asdict(minimal))}'")
+            sys.exit(1)
+        if time.monotonic() >= deadline:
+            break
+    print(f"{checked} cases passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import json
+import os
 import random
 import numpy as np
-from enum import IntEnum
-import matplotlib.pyplot as plt
+from dataclasses import dataclass
+from enum import IntEnum, StrEnum
+from multiprocessing import shared_memory
+from stats import BuildStats, StatsCallback, DISABLED
 
 class CellType(IntEnum):
     EMPTY = -1
@@ -9,21 +13,107 @@ class CellType(IntEnum):
     BUILDING = 1
 
 
+class Engine(StrEnum):
+    REFERENCE = "reference"
+    FAST = "fast"
+
+
+def smallest_cell_dtype(max_building_id: int) -> np.dtype:
+    """Smallest signed integer dtype that holds every cell value up to max_building_id."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if max_building_id <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def check_layout_parameters(width: int, height: int, max_road_width: int = 2, min_building_size: int = 2, max_building_size: int = 6):
+    """Raise ValueError for parameters the generators can't lay out (or would never finish laying out)."""
+    if width < 6 or height < 6:
+        raise ValueError("Width and height must be at least 6.")
+    if max_road_width < 1:
+        raise ValueError("max_road_width must be at least 1.")
+    if not 1 <= min_building_size <= max_building_size:
+        raise ValueError("Building sizes must satisfy 1 <= min_building_size <= max_building_size.")
+
+
+def tile_bounds(height: int, width: int, tile_size: int | None = None):
+    """(top, left, bottom, right) of every tile of a height × width grid in row-major order; the whole grid when not tiled."""
+    size = tile_size or max(height, width)
+    for top in range(0, height, size):
+        for left in range(0, width, size):
+            yield top, left, min(top + size, height), min(left + size, width)
+
+
+def building_extents(cells: np.ndarray, building_count: int, tile_size: int | None = None) -> tuple[np.ndarray, ...]:
+    """(min_row, min_column, max_row, max_column) of every building, indexed by ID, read in one pass.
+
+    The cells are read one tile at a time, so a memory-mapped grid is never loaded whole and the
+    scratch arrays stay the size of a tile however wide the grid is; IDs without a cell have max_row -1.
+    """
+    height, width = cells.shape
+    size = max(building_count, 1)
+    min_row = np.full(size, height, dtype=np.int64)
+    min_column = np.full(size, width, dtype=np.int64)
+    max_row = np.full(size, -1, dtype=np.int64)
+    max_column = np.full(size, -1, dtype=np.int64)
+    for top, left, bottom, right in tile_bounds(height, width, tile_size):
+        tile = np.asarray(cells[top:bottom, left:right])
+        row, column = np.nonzero(tile >= 1)
+        ids = tile[row, column]
+        row += top
+        column += left
+        # Buildings crossing tile borders are merged by reducing into the same per-ID arrays.
+        np.minimum.at(min_row, ids, row)
+        np.minimum.at(min_column, ids, column)
+        np.maximum.at(max_row, ids, row)
+        np.maximum.at(max_column, ids, column)
+    return min_row, min_column, max_row, max_column
+
+
+@dataclass(frozen=True)
+class SharedGrid:
+    """Picklable handle to a grid published with Grid.share(), for Grid.attach() in worker processes."""
+    name: str
+    shape: tuple[int, int]
+    dtype: str
+    warehouses: tuple[int, ...]
+    meta: dict
+
+
 class Grid:
-    def __init__(self, width: int, height: int, max_road_width: int = 2, min_building_size: int = 2, max_building_size: int = 6):
-        if width < 6 or height < 6:
-            raise ValueError("Width and height must be at least 6.")
+    def __init__(self, width: int, height: int, max_road_width: int = 2, min_building_size: int = 2, max_building_size: int = 6,
+                 seed: int | None = None, engine: Engine = Engine.REFERENCE, tile_size: int | None = None, path: str | None = None,
+                 instrument: bool = False, on_stats: StatsCallback | None = None):
+        check_layout_parameters(width, height, max_road_width, min_building_size, max_building_size)
+        if tile_size is not None and Engine(engine) != Engine.FAST:
+            raise ValueError("Tiled generation needs the fast engine.")
         self.width = width
         self.height = height
-        self.grid = np.full((height, width), CellType.EMPTY, dtype=int)
+        self.tile_size = tile_size
         self.next_building_id = 1
         self._max_road_width = max_road_width
         self._min_building_size = min_building_size 
         self._max_building_size = max_building_size
+        if path is None:
+            self.grid = np.full((height, width), CellType.EMPTY, dtype=self._layout_dtype())
+        else:
+            # A .npy file mapped into memory, so only the tiles being worked on need to be in RAM.
+            self.grid = np.lib.format.open_memmap(path, mode='w+', dtype=self._layout_dtype(), shape=(height, width))
+        self._shared_memory = None
+        self._seed = seed
+        self._engine = Engine(engine)
+        self._random = random if seed is None else random.Random(seed)
+        self._rng = np.random.default_rng(seed)
         self.warehouses = set()
-        self._generate_random_layout()
-        self._generate_warehouses()
+        self._instrument = instrument or on_stats is not None
+        self._on_stats = on_stats
+        self.stats = None
+        self._generate()
     
+    def _layout_dtype(self) -> np.dtype:
+        """Smallest dtype that fits any generated layout, since every building covers min_building_size² cells."""
+        return smallest_cell_dtype(max(self.width * self.height // max(self._min_building_size, 1) ** 2, 1))
+
     def _is_valid_position(self, x: int, y: int) -> bool:
         """Check if the given position is within grid bounds."""
         return 0 <= x < self.width and 0 <= y < self.height
@@ -35,13 +125,46 @@ class Grid:
                 if not self._is_valid_position(x, y) or self.grid[y, x] != CellType.EMPTY:
                     return False
         
+        self._make_writable()
         building_id = self.next_building_id
+        if building_id > np.iinfo(self.grid.dtype).max:
+            self._widen(smallest_cell_dtype(building_id))
         for y in range(start_y, start_y + height):
             for x in range(start_x, start_x + width):
                 self.grid[y, x] = building_id
         self.next_building_id += 1
         return True
     
+    def _widen(self, dtype: np.dtype):
+        """Widen the cells to dtype. A grid memory-mapped for writing is rewritten in its file at
+        the wider dtype, one band at a time, and mapped again, so it stays backed by the file."""
+        if not (isinstance(self.grid, np.memmap) and self.grid.mode in ('r+', 'w+')):
+            # A plain array, so a copy-on-write mapping isn't mistaken for a file-backed grid later.
+            self.grid = np.array(self.grid, dtype=dtype)
+            return
+        path = self.grid.filename
+        widening_path = f"{path}.widening.npy"
+        widened = np.lib.format.open_memmap(widening_path, mode='w+', dtype=dtype, shape=self.grid.shape)
+        rows = self.tile_size or self.height
+        for y in range(0, self.height, rows):
+            widened[y:y + rows] = self.grid[y:y + rows]
+        widened.flush()
+        # Both mappings are dropped before the file is replaced, which Windows requires.
+        del widened
+        self.grid = None
+        os.replace(widening_path, path)
+        self.grid = np.lib.format.open_memmap(path, mode='r+')
+
+    def _remove_building(self, building_id: int) -> bool:
+        """Remove a building from the grid. Returns False if there is no building with that ID."""
+        cells = self.grid == building_id
+        if building_id < 1 or not cells.any():
+            return False
+        self._make_writable()
+        self.grid[cells] = CellType.EMPTY
+        self.warehouses.discard(building_id)
+        return True
+
     def _place_road(self, x: int, y: int, width: int = 1) -> bool:
         """Place a road segment. Returns False if placement is invalid."""
         if not self._is_valid_position(x, y):
@@ -85,53 +208,242 @@ class Grid:
 
     def reset(self):
         """Reset the grid and generate a new random layout."""
-        self._generate_random_layout()
-        self._generate_warehouses()
+        self._generate()
+
+    def _make_writable(self):
+        """Copy read-only cells, e.g. of a grid loaded memory-mapped, into private memory before changing them."""
+        if self.grid.flags.writeable:
+            return
+        if self._shared_memory is not None:
+            raise ValueError("A grid attached to shared memory is read-only.")
+        self.grid = np.array(self.grid)
+
+    def _generate(self):
+        """Generate the layout and warehouses, collecting stats into self.stats when instrumented."""
+        self.stats = BuildStats() if self._instrument else None
+        self._stats = self.stats if self.stats is not None else DISABLED
+        self._make_writable()
+        in_memory = not isinstance(self.grid, np.memmap)
+        if in_memory and self.grid.dtype.itemsize < self._layout_dtype().itemsize:
+            self.grid = np.full(self.grid.shape, CellType.EMPTY, dtype=self._layout_dtype())
+        with self._stats.phase("total"):
+            self._generate_random_layout()
+            with self._stats.phase("warehouses"):
+                self._generate_warehouses()
+        if in_memory:
+            # The layout bound is loose, so the cells are narrowed to what this layout needs.
+            self.grid = self.grid.astype(smallest_cell_dtype(self.next_building_id - 1), copy=False)
+        self._stats.count("buildings", self.next_building_id - 1)
+        self._stats.count("warehouses", len(self.warehouses))
+        if self._on_stats is not None:
+            self._on_stats(self.stats)
 
     def _generate_random_layout(self):
         """Generate a random layout with roads first, then buildings."""
+        if self._engine == Engine.REFERENCE:
+            self._generate_random_layout_reference()
+        elif self.tile_size is None:
+            self._generate_random_layout_fast()
+        else:
+            self._generate_tiled_layout()
+
+    @staticmethod
+    def _summed_area_table(mask: np.ndarray) -> np.ndarray:
+        """Summed-area table with a leading row and column of zeros."""
+        table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+        np.cumsum(np.cumsum(mask, axis=0), axis=1, out=table[1:, 1:])
+        return table
+
+    @staticmethod
+    def _rectangle_sums(table: np.ndarray, x, y, width, height) -> np.ndarray:
+        """Sum of the cells in each rectangle, read from a summed-area table in O(1) per rectangle."""
+        return table[y + height, x + width] - table[y, x + width] - table[y + height, x] + table[y, x]
+
+    def _road_lines(self, length: int) -> np.ndarray:
+        """Mask of the rows (or columns) of a `length` long axis that are roads, drawn from self._rng."""
+        roads = np.zeros(length, dtype=bool)
+        size_span = self._max_building_size - self._min_building_size
+        position = 2
+        while position < length - 2:
+            road_width = int(self._rng.integers(1, self._max_road_width + 1))
+            roads[position:position + road_width] = True
+            position += road_width + self._min_building_size + int(self._rng.integers(0, size_span + 1))
+        return roads
+
+    def _generate_random_layout_fast(self):
+        """Same layout rules as the reference generator, driven by self._rng and checked in batches."""
+
+        self.grid.fill(CellType.EMPTY)
+        self.next_building_id = 1
+
+        with self._stats.phase("roads"):
+            road_rows = self._road_lines(self.height)
+            road_columns = self._road_lines(self.width)
+            self.grid[road_rows, :] = CellType.ROAD
+            self.grid[:, road_columns] = CellType.ROAD
+        self._count_road_cells(road_rows, road_columns)
+
+        with self._stats.phase("buildings"):
+            self._place_buildings(self.grid, self._near_road(road_rows, road_columns), self._rng)
+
+    def _generate_tiled_layout(self):
+        """Generate the layout one tile at a time, with buildings kept inside their tile.
+
+        Roads are drawn for the whole grid as row/column masks first, so a tile only needs those
+        and its own cells; every tile gets its own generator spawned from self._rng.
+        """
+        self.next_building_id = 1
+        with self._stats.phase("roads"):
+            road_rows = self._road_lines(self.height)
+            road_columns = self._road_lines(self.width)
+        self._count_road_cells(road_rows, road_columns)
+        tile_size = self.tile_size
+        tile_starts = [(y, x) for y in range(0, self.height, tile_size) for x in range(0, self.width, tile_size)]
+        self._stats.count("tiles", len(tile_starts))
+
+        for (y, x), rng in zip(tile_starts, self._rng.spawn(len(tile_starts))):
+            end_y, end_x = min(y + tile_size, self.height), min(x + tile_size, self.width)
+            tile = np.full((end_y - y, end_x - x), CellType.EMPTY, dtype=self.grid.dtype)
+            tile[road_rows[y:end_y], :] = CellType.ROAD
+            tile[:, road_columns[x:end_x]] = CellType.ROAD
+
+            halo_y, halo_x = max(y - 1, 0), max(x - 1, 0)
+            near_road = self._near_road(road_rows[halo_y:end_y + 1], road_columns[halo_x:end_x + 1])
+            with self._stats.phase("buildings"):
+                self._place_buildings(tile, near_road[y - halo_y:y - halo_y + tile.shape[0], x - halo_x:x - halo_x + tile.shape[1]], rng)
+            self.grid[y:end_y, x:end_x] = tile
+
+        if isinstance(self.grid, np.memmap):
+            self.grid.flush()
+
+    def _count_road_cells(self, road_rows: np.ndarray, road_columns: np.ndarray):
+        rows, columns = int(road_rows.sum()), int(road_columns.sum())
+        self._stats.count("road_cells", rows * self.width + columns * self.height - rows * columns)
+
+    @staticmethod
+    def _near_road(road_rows: np.ndarray, road_columns: np.ndarray) -> np.ndarray:
+        """Cells that are a road or touch one, corners included, for roads given as row/column masks."""
+        # A rectangle with no road inside touches a road exactly when it contains one of these cells.
+        near_rows = road_rows.copy()
+        near_rows[1:] |= road_rows[:-1]
+        near_rows[:-1] |= road_rows[1:]
+        near_columns = road_columns.copy()
+        near_columns[1:] |= road_columns[:-1]
+        near_columns[:-1] |= road_columns[1:]
+        return near_rows[:, None] | near_columns[None, :]
+
+    def _place_buildings(self, area: np.ndarray, near_road: np.ndarray, rng: np.random.Generator):
+        """Place random buildings in `area` until 200 candidates in a row fail, numbering them from next_building_id."""
+        area_height, area_width = area.shape
+        max_width = min(self._max_building_size, area_width)
+        max_height = min(self._max_building_size, area_height)
+        if max_width < self._min_building_size or max_height < self._min_building_size:
+            return
+        near_road_table = self._summed_area_table(near_road)
 
+        # Candidates are tested against the occupancy at the start of their batch; the ones
+        # that pass are re-checked against the live area, since earlier candidates of the same
+        # batch may have taken their cells.
+        batch_size = max(256, area.size // 64)
+        attempts = 200
+        # Candidates rejected before the 200-failure stop, counted like the reference's loop.
+        rejected = placed = 0
+        while attempts > 0:
+            occupied_table = self._summed_area_table(area != CellType.EMPTY)
+            width = rng.integers(self._min_building_size, max_width + 1, size=batch_size)
+            height = rng.integers(self._min_building_size, max_height + 1, size=batch_size)
+            x = rng.integers(0, area_width - width + 1)
+            y = rng.integers(0, area_height - height + 1)
+
+            valid = (self._rectangle_sums(near_road_table, x, y, width, height) > 0) & \
+                    (self._rectangle_sums(occupied_table, x, y, width, height) == 0)
+
+            next_candidate = 0
+            for i in np.flatnonzero(valid).tolist():
+                rejected += min(i - next_candidate, attempts)
+                attempts -= i - next_candidate
+                if attempts <= 0:
+                    break
+                next_candidate = i + 1
+
+                start_x, start_y = int(x[i]), int(y[i])
+                cells = area[start_y:start_y + int(height[i]), start_x:start_x + int(width[i])]
+                if (cells != CellType.EMPTY).any():
+                    rejected += 1
+                    attempts -= 1
+                    if attempts == 0:
+                        break
+                    continue
+
+                cells[...] = self.next_building_id
+                self.next_building_id += 1
+                placed += 1
+                attempts = 200
+            else:
+                rejected += min(batch_size - next_candidate, attempts)
+                attempts -= batch_size - next_candidate
+
+        self._stats.count("placement_attempts", placed + rejected)
+        self._stats.count("placement_rejections", rejected)
+
+    def _generate_random_layout_reference(self):
         self.grid.fill(CellType.EMPTY)
         self.next_building_id = 1
 
+        with self._stats.phase("roads"):
+            self._place_roads_reference()
+
+        with self._stats.phase("buildings"):
+            self._place_buildings_reference()
+
+    def _place_roads_reference(self):
         road_cells = 0
 
         y = 2
         while y < self.height - 2:
-            road_width = random.randint(1, self._max_road_width)
+            road_width = self._random.randint(1, self._max_road_width)
             for w in range(road_width):
                 if y + w < self.height:
                     for x in range(self.width):
                         if self.grid[y + w, x] != CellType.ROAD:
                             self.grid[y + w, x] = CellType.ROAD
                             road_cells += 1
-            y += road_width + self._min_building_size + random.randint(0, self._max_building_size - self._min_building_size)
+            y += road_width + self._min_building_size + self._random.randint(0, self._max_building_size - self._min_building_size)
 
         x = 2
         while x < self.width - 2:
-            road_width = random.randint(1, self._max_road_width)
+            road_width = self._random.randint(1, self._max_road_width)
             for w in range(road_width):
                 if x + w < self.width:
                     for y in range(self.height):
                         if self.grid[y, x + w] != CellType.ROAD:
                             self.grid[y, x + w] = CellType.ROAD
                             road_cells += 1
-            x += road_width + self._min_building_size + random.randint(0, self._max_building_size - self._min_building_size)
+            x += road_width + self._min_building_size + self._random.randint(0, self._max_building_size - self._min_building_size)
+
+        self._stats.count("road_cells", road_cells)
 
+    def _place_buildings_reference(self):
+        tried = rejected = 0
         attempts = 200
         while attempts > 0:
-            width = random.randint(self._min_building_size, self._max_building_size)
-            height = random.randint(self._min_building_size, self._max_building_size)
-            x = random.randint(0, self.width - width)
-            y = random.randint(0, self.height - height)
+            tried += 1
+            width = self._random.randint(self._min_building_size, self._max_building_size)
+            height = self._random.randint(self._min_building_size, self._max_building_size)
+            x = self._random.randint(0, self.width - width)
+            y = self._random.randint(0, self.height - height)
             
             if self._is_adjacent_to_road(x, y, width, height):
                 if self._place_building(x, y, width, height):
                     attempts = 200
                     continue
             
+            rejected += 1
             attempts -= 1
 
+        self._stats.count("placement_attempts", tried)
+        self._stats.count("placement_rejections", rejected)
+
     def __str__(self) -> str:
         """Return a string representation of the grid."""
         result = ""
@@ -146,17 +458,160 @@ class Grid:
             result += "\n"
         return result
     
+    def save(self, path: str):
+        """Save the grid to a directory: grid.npy (smallest sufficient dtype), warehouses.npy and meta.json."""
+        os.makedirs(path, exist_ok=True)
+        cells = np.lib.format.open_memmap(os.path.join(path, "grid.npy"), mode='w+',
+                                          dtype=smallest_cell_dtype(self.next_building_id - 1), shape=self.grid.shape)
+        rows = self.tile_size or self.height
+        for y in range(0, self.height, rows):
+            cells[y:y + rows] = self.grid[y:y + rows]
+        cells.flush()
+        del cells
+        np.save(os.path.join(path, "warehouses.npy"), np.array(sorted(self.warehouses), dtype=np.int64))
+        with open(os.path.join(path, "meta.json"), "w") as file:
+            json.dump(self._meta(), file)
+
+    def _meta(self) -> dict:
+        """Everything but the cells and warehouses, as plain JSON-compatible values."""
+        return {
+            "format": 1,
+            "width": self.width,
+            "height": self.height,
+            "max_road_width": self._max_road_width,
+            "min_building_size": self._min_building_size,
+            "max_building_size": self._max_building_size,
+            "seed": self._seed,
+            "engine": str(self._engine),
+            "tile_size": self.tile_size,
+            "next_building_id": self.next_building_id,
+            "rng_state": self._rng.bit_generator.state,
+            # Tiled generation spawns child generators, which the bit generator state doesn't cover.
+            "seed_sequence": self._seed_sequence_meta(),
+            "random_state": None if self._seed is None else self._random.getstate(),
+        }
+
+    def _seed_sequence_meta(self) -> dict:
+        sequence = self._rng.bit_generator.seed_seq
+        return {"entropy": sequence.entropy, "spawn_key": list(sequence.spawn_key), "n_children_spawned": sequence.n_children_spawned}
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str | None = 'r') -> "Grid":
+        """Load a grid saved with save(). By default the cells are memory-mapped read-only, without copying.
+
+        The file is never written: changing the grid (reset(), placing or removing buildings)
+        first copies the cells into memory.
+        """
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta.get("format") != 1:
+            raise ValueError(f"Unsupported grid format in {path}.")
+        cells = np.load(os.path.join(path, "grid.npy"), mmap_mode=mmap_mode)
+        return cls._from_meta(meta, cells, np.load(os.path.join(path, "warehouses.npy")).tolist())
+
+    @classmethod
+    def _from_meta(cls, meta: dict, cells: np.ndarray, warehouses) -> "Grid":
+        grid = cls.__new__(cls)
+        grid.width = meta["width"]
+        grid.height = meta["height"]
+        grid.tile_size = meta["tile_size"]
+        grid.grid = cells
+        grid.next_building_id = meta["next_building_id"]
+        grid._max_road_width = meta["max_road_width"]
+        grid._min_building_size = meta["min_building_size"]
+        grid._max_building_size = meta["max_building_size"]
+        grid._seed = meta["seed"]
+        grid._engine = Engine(meta["engine"])
+        sequence = meta.get("seed_sequence")
+        if sequence is None:
+            grid._rng = np.random.default_rng()
+        else:
+            grid._rng = np.random.Generator(np.random.PCG64(np.random.SeedSequence(
+                sequence["entropy"], spawn_key=tuple(sequence["spawn_key"]), n_children_spawned=sequence["n_children_spawned"])))
+        grid._rng.bit_generator.state = meta["rng_state"]
+        if meta["random_state"] is None:
+            grid._random = random
+        else:
+            version, internal_state, gauss_next = meta["random_state"]
+            grid._random = random.Random()
+            grid._random.setstate((version, tuple(internal_state), gauss_next))
+        grid.warehouses = set(warehouses)
+        grid._instrument = False
+        grid._on_stats = None
+        grid.stats = None
+        grid._stats = DISABLED
+        grid._shared_memory = None
+        return grid
+
+    def share(self) -> SharedGrid:
+        """Move the cells into a shared-memory block and return a handle that workers pass to attach().
+
+        The cells are copied once; after that this grid and every attached grid read the same
+        buffer. Call unshare() when the workers are done, to free the block.
+        """
+        if self._shared_memory is None:
+            block = shared_memory.SharedMemory(create=True, size=max(self.grid.nbytes, 1))
+            cells = np.ndarray(self.grid.shape, dtype=self.grid.dtype, buffer=block.buf)
+            cells[...] = self.grid
+            self.grid = cells
+            self._shared_memory = block
+            self._owns_shared_memory = True
+        return SharedGrid(self._shared_memory.name, self.grid.shape, self.grid.dtype.str, tuple(sorted(self.warehouses)), self._meta())
+
+    @classmethod
+    def attach(cls, handle: SharedGrid) -> "Grid":
+        """A read-only grid on the shared block of another process's share(), without copying the cells."""
+        try:
+            # Python 3.13+: an attaching process must not unlink the block when it exits.
+            block = shared_memory.SharedMemory(name=handle.name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name=handle.name)
+        cells = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=block.buf)
+        cells.flags.writeable = False
+        grid = cls._from_meta(handle.meta, cells, handle.warehouses)
+        grid._shared_memory = block
+        grid._owns_shared_memory = False
+        return grid
+
+    def unshare(self):
+        """Stop using shared memory and close the block.
+
+        The grid that called share() copies its cells back into private memory and frees the
+        block, so it must outlive the attached grids. An attached grid is only detached, without
+        copying, and has no cells afterwards; no other references to its cells may be left.
+        """
+        if self._shared_memory is None:
+            return
+        self.grid = np.array(self.grid) if self._owns_shared_memory else None
+        self._shared_memory.close()
+        if self._owns_shared_memory:
+            self._shared_memory.unlink()
+        self._shared_memory = None
+
     def _generate_warehouses(self):
         """Generate warehouses in the grid."""
         self.warehouses = set() 
         warehouse_count = np.ceil(0.1 * (self.next_building_id - 1))
-        warehouse_ids = random.sample(range(1, self.next_building_id), int(warehouse_count))
+        if self._engine == Engine.REFERENCE:
+            warehouse_ids = self._random.sample(range(1, self.next_building_id), int(warehouse_count))
+        else:
+            warehouse_ids = self._rng.choice(np.arange(1, self.next_building_id), int(warehouse_count), replace=False).tolist()
         for warehouse_id in warehouse_ids:
             self.warehouses.add(warehouse_id)
 
-    def visualize_grid(self):
-        """Visualize the grid and save it as a PNG file, showing building values."""
-        
+    def visualize_grid(self, path: str = 'grid.png', pixels_per_cell: int | None = None, labels: bool = True):
+        """Visualize the grid and save it as a PNG file, showing building values.
+
+        With pixels_per_cell the PNG is rasterized directly at that many pixels per cell, with one
+        label per building where it fits; otherwise it is drawn with matplotlib, one label per cell.
+        """
+        if pixels_per_cell is not None:
+            self._render_raster(path, pixels_per_cell, labels)
+            return
+
+        # Plotting libraries are only imported when rendering, so headless users never load them.
+        import matplotlib.pyplot as plt
+
         WHITE = (1.0, 1.0, 1.0)  # Empty (-1)
         BLACK = (0.0, 0.0, 0.0)  # Road (0)
         BLUE = (0.0, 0.0, 1.0)   # Building (>= 1)
@@ -184,9 +639,64 @@ class Grid:
         plt.axis('on')
         plt.xticks(ticks=np.arange(self.width), labels=np.arange(self.width))
         plt.yticks(ticks=np.arange(self.height), labels=np.arange(self.height))
-        plt.savefig('grid.png', bbox_inches='tight', pad_inches=0)
+        plt.savefig(path, bbox_inches='tight', pad_inches=0)
         plt.close()
 
+    def _render_raster(self, path: str, pixels_per_cell: int, labels: bool):
+        from PIL import Image
+
+        WHITE = (255, 255, 255)  # Empty (-1)
+        BLACK = (0, 0, 0)        # Road (0)
+        BLUE = (0, 0, 255)       # Building (>= 1)
+        RED = (255, 0, 0)        # Warehouse (building in warehouses list)
+
+        # Colour lookup table indexed by cell value + 1.
+        palette = np.empty((self.next_building_id + 1, 3), dtype=np.uint8)
+        palette[0] = WHITE
+        palette[1] = BLACK
+        palette[2:] = BLUE
+        palette[np.array(sorted(self.warehouses), dtype=np.int64) + 1] = RED
+
+        image = np.empty((self.height * pixels_per_cell, self.width * pixels_per_cell, 3), dtype=np.uint8)
+        band = self.tile_size or self.height
+        for y in range(0, self.height, band):
+            # Widened first: with int8/int16 cells the offset would wrap the highest IDs around.
+            colors = palette[np.asarray(self.grid[y:y + band]).astype(np.intp) + 1]
+            image[y * pixels_per_cell:(y + band) * pixels_per_cell] = colors.repeat(pixels_per_cell, axis=0).repeat(pixels_per_cell, axis=1)
+
+        picture = Image.fromarray(image)
+        if labels:
+            self._draw_building_labels(picture, pixels_per_cell)
+        picture.save(path)
+
+    def _draw_building_labels(self, picture, pixels_per_cell: int):
+        """Write each building ID once, centred on the building, if it fits inside it at this zoom."""
+        from PIL import ImageDraw, ImageFont
+
+        size = self.next_building_id
+        min_y, min_x, max_y, max_x = building_extents(self.grid, size, self.tile_size)
+
+        draw = ImageDraw.Draw(picture)
+        font = ImageFont.load_default()
+        text_size = {}
+        for digits in range(1, len(str(max(size - 1, 1))) + 1):
+            left, top, right, bottom = draw.textbbox((0, 0), "8" * digits, font=font)
+            text_size[digits] = (right - left, bottom - top)
+
+        ids = np.flatnonzero(max_x >= 0)
+        digits = np.char.str_len(ids.astype(str))
+        text_width = np.array([text_size[d][0] for d in range(1, len(text_size) + 1)])[digits - 1]
+        text_height = np.array([text_size[d][1] for d in range(1, len(text_size) + 1)])[digits - 1]
+        fits = ((max_x[ids] - min_x[ids] + 1) * pixels_per_cell >= text_width) & ((max_y[ids] - min_y[ids] + 1) * pixels_per_cell >= text_height)
+
+        for id, x0, y0, x1, y1 in zip(ids[fits].tolist(), min_x[ids[fits]].tolist(), min_y[ids[fits]].tolist(),
+                                      max_x[ids[fits]].tolist(), max_y[ids[fits]].tolist()):
+            label = str(id)
+            left, top, right, bottom = draw.textbbox((0, 0), label, font=font)
+            center_x = (x0 + x1 + 1) * pixels_per_cell / 2
+            center_y = (y0 + y1 + 1) * pixels_per_cell / 2
+            draw.text((center_x - (right + left) / 2, center_y - (bottom + top) / 2), label, fill=(255, 255, 255), font=font)
+
 
 if __name__ == "__main__":
     grid = Grid(10, 10)
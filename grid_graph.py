@@ -1,9 +1,16 @@
-import networkx as nx
-from grid import Grid, CellType
+from grid import Grid, CellType, Engine, building_extents, tile_bounds
 import numpy as np
+import bisect
+import os
+from collections import deque
+from dataclasses import dataclass, field
 from enum import StrEnum
-from graphviz import Digraph
-from networkx.drawing.nx_agraph import to_agraph
+import itertools
+from typing import TYPE_CHECKING
+from stats import BuildStats, StatsCallback, DISABLED
+
+if TYPE_CHECKING:
+    import networkx as nx
 
 class NodeType(StrEnum):
     BUILDING = "building"
@@ -12,23 +19,300 @@ class NodeType(StrEnum):
     ROAD_END = "road_end"
 
 
+@dataclass
+class GraphChanges:
+    """Nodes and edges changed by an incremental update. Edges are (u, v) with u <= v."""
+    added_nodes: set = field(default_factory=set)
+    removed_nodes: set = field(default_factory=set)
+    retyped_nodes: set = field(default_factory=set)
+    added_edges: set = field(default_factory=set)
+    removed_edges: set = field(default_factory=set)
+    reweighted_edges: set = field(default_factory=set)
+
+    def is_empty(self) -> bool:
+        return not any(vars(self).values())
+
+
+def _edge_key(u, v):
+    return (u, v) if u <= v else (v, u)
+
+
+class Backend(StrEnum):
+    NETWORKX = "networkx"
+    ARRAYS = "arrays"
+
+
+class CompactGraph:
+    """Array-backed graph: integer node IDs, per-node arrays and symmetric CSR adjacency.
+
+    Node i has bounding box bounding_boxes[i], type list(NodeType)[node_types[i]] and building
+    ID node_ids[i] (-1 for road features). Its neighbours are indices[indptr[i]:indptr[i + 1]]
+    with the edge weights at the same positions in weights.
+    """
+
+    def __init__(self, bounding_boxes, node_types, node_ids, indptr, indices, weights):
+        self.bounding_boxes = bounding_boxes
+        self.node_types = node_types
+        self.node_ids = node_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+
+    @classmethod
+    def from_edges(cls, bounding_boxes, node_types, node_ids, sources, targets, weights) -> "CompactGraph":
+        """Build the CSR adjacency from one (source, target, weight) entry per undirected edge."""
+        node_count = len(node_types)
+        sources = np.asarray(sources, dtype=np.int32)
+        targets = np.asarray(targets, dtype=np.int32)
+        weights = np.asarray(weights, dtype=np.int32)
+        not_loop = sources != targets
+        rows = np.concatenate([sources, targets[not_loop]])
+        columns = np.concatenate([targets, sources[not_loop]])
+        order = np.argsort(rows, kind='stable')
+
+        indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=node_count), out=indptr[1:])
+        return cls(bounding_boxes, node_types, node_ids, indptr, columns[order], np.concatenate([weights, weights[not_loop]])[order])
+
+    @classmethod
+    def from_nodes_and_edges(cls, nodes, edges) -> "CompactGraph":
+        """Build from (node, data) pairs in order and (u, v, weight) edges keyed by node."""
+        node_type_codes = {node_type: code for code, node_type in enumerate(NodeType)}
+        index = {node: i for i, (node, _) in enumerate(nodes)}
+        edges = list(edges)
+        return cls.from_edges(
+            np.array([node for node, _ in nodes], dtype=np.int32).reshape(-1, 4),
+            np.array([node_type_codes[data['type']] for _, data in nodes], dtype=np.int8),
+            np.array([data.get('id', -1) for _, data in nodes], dtype=np.int32),
+            [index[u] for u, _, _ in edges],
+            [index[v] for _, v, _ in edges],
+            [weight for _, _, weight in edges],
+        )
+
+    @classmethod
+    def from_networkx(cls, graph: "nx.Graph") -> "CompactGraph":
+        return cls.from_nodes_and_edges(list(graph.nodes(data=True)), ((u, v, data.get('weight', 1)) for u, v, data in graph.edges(data=True)))
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_types)
+
+    def number_of_edges(self) -> int:
+        return len(self.edge_arrays()[0])
+
+    def neighbors(self, node: int) -> np.ndarray:
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbor_weights(self, node: int) -> np.ndarray:
+        return self.weights[self.indptr[node]:self.indptr[node + 1]]
+
+    def edge_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sources, targets and weights with one entry per undirected edge (source <= target)."""
+        rows = np.repeat(np.arange(self.number_of_nodes(), dtype=np.int32), np.diff(self.indptr))
+        upper = rows <= self.indices
+        return rows[upper], self.indices[upper], self.weights[upper]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.bounding_boxes, self.node_types, self.node_ids, self.indptr, self.indices, self.weights))
+
+    def to_networkx(self) -> "nx.Graph":
+        import networkx as nx
+
+        node_types = list(NodeType)
+        graph = nx.Graph()
+        for box, code, id in zip(self.bounding_boxes.tolist(), self.node_types.tolist(), self.node_ids.tolist()):
+            node_type = node_types[code]
+            if node_type in (NodeType.BUILDING, NodeType.WAREHOUSE):
+                graph.add_node(tuple(box), type=node_type, id=id)
+            else:
+                graph.add_node(tuple(box), type=node_type)
+        boxes = [tuple(box) for box in self.bounding_boxes.tolist()]
+        sources, targets, weights = self.edge_arrays()
+        graph.add_weighted_edges_from((boxes[u], boxes[v], w) for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist()))
+        return graph
+
+
+def _merge_edges(node_count, sources, targets, weights) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """One entry per repeated (source, target) edge at its first position with its last weight, as in nx.Graph."""
+    keys = sources.astype(np.int64) * max(node_count, 1) + targets
+    _, first = np.unique(keys, return_index=True)
+    _, last = np.unique(keys[::-1], return_index=True)
+    order = np.argsort(first)
+    first, last = first[order], len(keys) - 1 - last[order]
+    return sources[first], targets[first], weights[last]
+
+
+def _merge_duplicate_nodes(boxes, types, ids) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray | None]:
+    """Nodes sharing a bounding box merged into the first, as repeated nx.Graph.add_node calls do.
+
+    The last node's type wins, and building IDs, which are added in increasing order, the last
+    one given. Also returns the new index of every old node, or None when nothing was merged.
+    """
+    order = np.lexsort(boxes.T[::-1])
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (boxes[order[1:]] != boxes[order[:-1]]).any(axis=1)
+    if starts.all():
+        return boxes, types, ids, None
+    group = np.cumsum(starts) - 1
+    # lexsort is stable, so every group runs from its first node to its last.
+    first, last = order[starts], order[np.append(starts[1:], True)]
+    kept = np.sort(first)
+    new_index = np.empty(len(first), dtype=np.int64)
+    new_index[np.argsort(first)] = np.arange(len(first))
+    node_of = np.empty(len(order), dtype=np.int64)
+    node_of[order] = new_index[group]
+    group_ids = np.full(len(first), -1, dtype=ids.dtype)
+    np.maximum.at(group_ids, group, ids[order])
+    merged_types = np.empty(len(first), dtype=types.dtype)
+    merged_types[new_index] = types[last]
+    merged_ids = np.empty(len(first), dtype=ids.dtype)
+    merged_ids[new_index] = group_ids
+    return boxes[kept], merged_types, merged_ids, node_of
+
+
+class _IntersectionGrouping:
+    """Groups intersection corners into nodes as the tiles are scanned, like _create_intersection_nodes_reference.
+
+    For a seed corner the reference joins every other corner on its row (column) that is
+    adjacent to it, or whose one-step-towards-the-other cell is an intersection edge. For the
+    corners after the seed that cell is the one after the seed, and for the corners before it
+    the one after that corner, so each corner needs one flag per axis: whether the cell after it
+    is an intersection edge. A flagged seed reaches the last corner on its line and uses up the
+    corners after it; a seed with a flagged corner before it reaches back to the first one and
+    uses up the flagged corners before it; an adjacent corner is joined and, after the seed,
+    used up. Corners arrive in row-major order within row-major tiles, so everything before a
+    corner on its row and column has been seen when it arrives, and the state kept is one value
+    per row and column. Only the last corner of a line is unknown until the end, so boxes that
+    reach it are finished in boxes().
+    """
+
+    def __init__(self, rows: int, cols: int):
+        # Per axis: lines are rows (positions along them are columns) and columns.
+        lines = (rows, cols)
+        self._first_flagged = [[-1] * count for count in lines]
+        self._suffix = [[max(lines)] * count for count in lines]
+        self._flagged_before = [[-1] * count for count in lines]
+        self._last = [[-1] * count for count in lines]
+        self._used = set()
+        self._nodes = []
+
+    def add(self, xs, ys, flags, before, after):
+        """Corners (xs, ys) in scan order, with per axis their flags and whether the previous and next cells are corners."""
+        first_flagged, suffix, flagged_before, last, used = self._first_flagged, self._suffix, self._flagged_before, self._last, self._used
+        nodes = []
+        for x, y, flag_row, flag_column, left, up, right, down in zip(xs, ys, *flags, *before, *after):
+            axes = ((0, x, y, flag_row, left, right, (x, y + 1)), (1, y, x, flag_column, up, down, (x + 1, y)))
+            seed = (x, y) not in used and not any(
+                along > suffix[axis][line] or (flagged and along < flagged_before[axis][line])
+                for axis, line, along, flagged, _, _, _ in axes
+            )
+            used.discard((x, y))
+            if seed:
+                bounds = []
+                for axis, line, along, flagged, previous, following, next_corner in axes:
+                    low = high = along
+                    if first_flagged[axis][line] >= 0:
+                        low = first_flagged[axis][line]
+                        flagged_before[axis][line] = max(flagged_before[axis][line], along)
+                    if previous:
+                        low = min(low, along - 1)
+                    if flagged:
+                        # Up to the last corner on the line, known once every tile is scanned.
+                        high = -1
+                        suffix[axis][line] = min(suffix[axis][line], along)
+                    elif following:
+                        high = along + 1
+                        used.add(next_corner)
+                    bounds.append((low, high))
+                (min_y, max_y), (min_x, max_x) = bounds
+                nodes.append((min_x, min_y, max_x, max_y, x, y))
+            for axis, line, along, flagged, _, _, _ in axes:
+                if flagged and first_flagged[axis][line] < 0:
+                    first_flagged[axis][line] = along
+                last[axis][line] = along
+        self._nodes.append(np.array(nodes, dtype=np.int32).reshape(-1, 6))
+
+    def boxes(self) -> np.ndarray:
+        """The distinct intersection bounding boxes, in the order the reference adds them to the graph.
+
+        The reference collects the boxes in a set in seed-corner order and adds them in its
+        iteration order, which decides how nodes tied along a road are linked. Seeds arrive
+        tile by tile, so they are put back in row-major order and the same set is rebuilt.
+        """
+        nodes = np.concatenate(self._nodes or [np.empty((0, 6), dtype=np.int32)])
+        min_x, min_y, max_x, max_y, x, y = nodes[np.lexsort((nodes[:, 5], nodes[:, 4]))].T
+        max_y = np.where(max_y < 0, np.array(self._last[0], dtype=np.int32)[x], max_y)
+        max_x = np.where(max_x < 0, np.array(self._last[1], dtype=np.int32)[y], max_x)
+        # Filled a chunk at a time and read back with fromiter, so the set is the only per-node Python
+        # state, and its tuples share one int object per coordinate.
+        coordinates = list(range(max(len(self._last[0]), len(self._last[1]))))
+        intersection_nodes = set()
+        for start in range(0, len(x), 65536):
+            columns = (map(coordinates.__getitem__, values[start:start + 65536].tolist()) for values in (min_x, min_y, max_x, max_y))
+            intersection_nodes.update(zip(*columns))
+        return np.fromiter(itertools.chain.from_iterable(intersection_nodes), dtype=np.int32,
+                           count=4 * len(intersection_nodes)).reshape(-1, 4)
+
 
 class GridGraph:
-    def __init__(self, grid: Grid):
+    def __init__(self, grid: Grid, engine: Engine = Engine.FAST, backend: Backend = Backend.NETWORKX, tile_size: int | None = None,
+                 instrument: bool = False, on_stats: StatsCallback | None = None):
+        self._setup(grid, engine, backend, tile_size, instrument, on_stats)
+        self._reset_state()
+        self.create_graph()
+
+    def _setup(self, grid, engine, backend, tile_size, instrument=False, on_stats=None):
         self._grid = grid
-        self._matrix = grid.grid
+        self._engine = Engine(engine)
+        self._backend = Backend(backend)
+        self._tile_size = tile_size if tile_size is not None else grid.tile_size
+        if self._tile_size is not None and self._engine != Engine.FAST:
+            raise ValueError("Tiled graph building needs the fast engine.")
         self._rows, self._cols = grid.height, grid.width
-        self._graph = nx.Graph()
         self._visited = set()
         self._orthogonal_directions = [(0, 1), (1, 0), (0, -1), (-1, 0)]
         self._diagonal_directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        self._road_matrix = np.where(self._matrix == CellType.ROAD, 0, 1)
-        self.create_graph()
+        # Stats of the last create_graph; self._stats is only live while a build runs.
+        self._instrument = instrument or on_stats is not None
+        self._on_stats = on_stats
+        self.stats = None
+        self._stats = DISABLED
+        # Bumped on every change to the graph, so caches built on it can tell they are stale.
+        self.version = 0
+
+    def _reset_state(self):
+        self._graph = None
+        self._compact = None
+        self._adjacency_index = None
+        self._road_end_pairs = []
+        self._road_chains = None
+        self._road_widths = None
+        self._edge_owners = None
+        self._pairs_by_line = None
+        self._building_nodes = None
+        self._warehouses = set(self._grid.warehouses)
+        self._label_raster = None
+        self._nearest_node_raster = None
+
+    @property
+    def _matrix(self) -> np.ndarray:
+        # Read through the grid, since Grid may swap its array (e.g. widening its dtype).
+        return self._grid.grid
 
     def _is_within_bounds(self, x, y):
         return 0 <= x < self._rows and 0 <= y < self._cols
     
-    def _find_building_nodes(self):
+    def _tile_bounds(self):
+        """(top, left, bottom, right) of every tile in row-major order; the whole grid when not tiled."""
+        return tile_bounds(self._rows, self._cols, self._tile_size)
+
+    def _building_extents(self) -> tuple[np.ndarray, np.ndarray]:
+        """IDs of the buildings on the grid, in increasing order, and their (N, 4) bounding boxes, read in a single pass."""
+        min_x, min_y, max_x, max_y = building_extents(self._matrix, self._grid.next_building_id, self._tile_size)
+        present = np.flatnonzero(max_x >= 0)
+        return present, np.stack([min_x[present], min_y[present], max_x[present], max_y[present]], axis=1)
+
+    def _find_building_nodes_reference(self):
         for id in range(1, self._grid.next_building_id):
             x, y = np.where(self._matrix == id)
             for i in range(len(x)):
@@ -47,7 +331,7 @@ class GridGraph:
             if not self._is_within_bounds(x, y):
                 on_edge = True
                 continue
-            sum += self._road_matrix[x][y]
+            sum += self._matrix[x][y] != CellType.ROAD
 
         return sum, on_edge
     
@@ -69,7 +353,45 @@ class GridGraph:
 
         return ort_sum == 0 and diag_sum == 0
     
-    def _create_intersection_nodes(self, intersection_corners):
+    def _group_end_of_road_corners(self, end_of_road_corners, run_labels) -> set[tuple[int, int, int, int]]:
+        """The road-end nodes _create_end_of_road_nodes_reference creates, in linear time.
+
+        Two corners on a line are joined by the reference when every cell between them is
+        walkable, so they are joined exactly when they share a run of walkable cells. run_labels
+        holds, per corner, the count of blocking cells up to it along its row / column, so
+        corners are bucketed by run.
+        """
+        runs = []
+        for axis, labels in ((0, run_labels[0]), (1, run_labels[1])):
+            run_corners = {}
+            for index, corner in enumerate(end_of_road_corners):
+                run_corners.setdefault((corner[axis], labels[index]), []).append(index)
+            runs.append((axis, labels, run_corners))
+
+        end_of_road_nodes = set()
+        used = [False] * len(end_of_road_corners)
+        consumed = set()
+        for index, corner in enumerate(end_of_road_corners):
+            if used[index]:
+                continue
+            used[index] = True
+            end_of_road = [corner]
+            for axis, labels, run_corners in runs:
+                key = (axis, corner[axis], labels[index])
+                if key in consumed:
+                    continue
+                consumed.add(key)
+                for other in run_corners[key[1:]]:
+                    if not used[other]:
+                        used[other] = True
+                        end_of_road.append(end_of_road_corners[other])
+
+            x = [corner[0] for corner in end_of_road]
+            y = [corner[1] for corner in end_of_road]
+            end_of_road_nodes.add((int(min(x)), int(min(y)), int(max(x)), int(max(y))))
+        return end_of_road_nodes
+
+    def _create_intersection_nodes_reference(self, intersection_corners):
         intersection_nodes = set()
         used_corners = set()
         
@@ -110,7 +432,7 @@ class GridGraph:
         for node in intersection_nodes:
             self._graph.add_node(node, type=NodeType.INTERSECTION)
 
-    def _create_end_of_road_nodes(self, end_of_road_corners):
+    def _create_end_of_road_nodes_reference(self, end_of_road_corners):
         end_of_road_nodes = set()
         used_corners = set()
         for corner in end_of_road_corners:
@@ -165,22 +487,159 @@ class GridGraph:
         for node in end_of_road_nodes:
             self._graph.add_node(node, type=NodeType.ROAD_END)
 
-    def _find_intersections_and_end_nodes(self):
+    def _scan_road_features(self):
+        """Intersection nodes and road-end corners, read from the grid one tile at a time.
+
+        Intersection corners are grouped into nodes as each tile is scanned (see
+        _IntersectionGrouping), so nothing per corner outlives its tile. Returns the (N, 4)
+        intersection bounding boxes in the reference's order, the number of intersection corners, and the road-end
+        corners, which only lie on the grid border, in row-major order like the reference scan
+        with their run labels (see _group_end_of_road_corners).
+        """
+        grouping = _IntersectionGrouping(self._rows, self._cols)
+        corner_count = 0
+        ends = []
+        column_blocked = np.zeros(self._cols, dtype=np.int32)
+        for top, left, bottom, right in self._tile_bounds():
+            height, width = bottom - top, right - left
+            if left == 0:
+                row_blocked = np.zeros(height, dtype=np.int32)
+
+            # Road matrix of the tile and two cells around it. Off-grid cells stay 0 so they add
+            # nothing to the sums, like in _check_direction_sum.
+            padded = np.zeros((height + 4, width + 4), dtype=np.int8)
+            block_top, block_left = max(top - 2, 0), max(left - 2, 0)
+            block = np.asarray(self._matrix[block_top:bottom + 2, block_left:right + 2])
+            offset_x, offset_y = block_top - top + 2, block_left - left + 2
+            padded[offset_x:offset_x + block.shape[0], offset_y:offset_y + block.shape[1]] = block != CellType.ROAD
+
+            # Neighbour sums and cell kinds for the tile and one cell around it, so corners can
+            # tell whether the cells next to them in other tiles are corners too.
+            def shifted_sum(directions):
+                total = np.zeros((height + 2, width + 2), dtype=np.int8)
+                for dx, dy in directions:
+                    total += padded[1 + dx:3 + dx + height, 1 + dy:3 + dy + width]
+                return total
+
+            ort_sum, diag_sum = shifted_sum(self._orthogonal_directions), shifted_sum(self._diagonal_directions)
+            rows, columns = np.arange(top - 1, bottom + 1)[:, None], np.arange(left - 1, right + 1)[None, :]
+            inside = (rows >= 0) & (rows < self._rows) & (columns >= 0) & (columns < self._cols)
+            # A cell has an off-grid orthogonal neighbour exactly when it has an off-grid diagonal one.
+            on_edge = (rows == 0) | (rows == self._rows - 1) | (columns == 0) | (columns == self._cols - 1)
+            road = inside & (padded[1:-1, 1:-1] == 0)
+            end_mask = road & on_edge & (ort_sum > 0) & (diag_sum > 0)
+            corner = road & ~end_mask & (ort_sum == 0) & (diag_sum != 0)
+            intersection_edge = (ort_sum == 0) & (diag_sum == 0)
+            if self.stats is not None:
+                self._stats.count("road_cells_scanned", int(np.count_nonzero(road[1:-1, 1:-1])))
+
+            x, y = np.nonzero(corner[1:-1, 1:-1])
+            corner_count += len(x)
+            grouping.add(
+                (x + top).tolist(), (y + left).tolist(),
+                ((intersection_edge[x + 1, y + 2] & (left + y + 1 < self._cols)).tolist(),
+                 (intersection_edge[x + 2, y + 1] & (top + x + 1 < self._rows)).tolist()),
+                (corner[x + 1, y].tolist(), corner[x, y + 1].tolist()),
+                (corner[x + 1, y + 2].tolist(), corner[x + 2, y + 1].tolist()),
+            )
+
+            # Runs continue across tiles through the blocking-cell counts carried along each row and column.
+            road, on_edge, ort_sum, end_mask = (mask[1:-1, 1:-1] for mask in (road, on_edge, ort_sum, end_mask))
+            blocked = ~(road & (on_edge | (ort_sum == 0)))
+            row_runs = np.cumsum(blocked, axis=1, dtype=np.int32) + row_blocked[:, None]
+            column_runs = np.cumsum(blocked, axis=0, dtype=np.int32) + column_blocked[None, left:right]
+            row_blocked += blocked.sum(axis=1)
+            column_blocked[left:right] += blocked.sum(axis=0)
+
+            x, y = np.nonzero(end_mask)
+            ends.append((x + top, y + left, row_runs[x, y], column_runs[x, y]))
+
+        x, y, along_row, along_column = (np.concatenate(parts) for parts in zip(*ends))
+        order = np.lexsort((y, x))
+        end_corners = list(zip(x[order].tolist(), y[order].tolist()))
+        return grouping.boxes(), corner_count, end_corners, (along_row[order].tolist(), along_column[order].tolist())
+
+    def _find_corners_reference(self):
         intersection_corners = []
         end_of_road_corners = []
-        roads = list(zip(*np.where(self._road_matrix == 0)))
+        roads = list(zip(*np.where(self._matrix == CellType.ROAD)))
+        self._stats.count("road_cells_scanned", len(roads))
         for road in roads:
             node_type = self._check_intersection_point_or_end(road)
             if node_type == NodeType.INTERSECTION:
                 intersection_corners.append(road)
             elif node_type == NodeType.ROAD_END:
                 end_of_road_corners.append(road)
+        return intersection_corners, end_of_road_corners
+
+    def _find_intersections_and_end_nodes_reference(self):
+        stats = self._stats
+        with stats.phase("corners"):
+            intersection_corners, end_of_road_corners = self._find_corners_reference()
+        stats.count("intersection_corners", len(intersection_corners))
+        stats.count("road_end_corners", len(end_of_road_corners))
+
+        nodes = self._graph.number_of_nodes()
+        with stats.phase("intersection_nodes"):
+            self._create_intersection_nodes_reference(intersection_corners)
+        stats.count("intersection_nodes", self._graph.number_of_nodes() - nodes)
+
+        nodes = self._graph.number_of_nodes()
+        with stats.phase("road_end_nodes"):
+            self._create_end_of_road_nodes_reference(end_of_road_corners)
+        stats.count("road_end_nodes", self._graph.number_of_nodes() - nodes)
+
+    def _typed_nodes(self) -> list[tuple[tuple[int, int, int, int], NodeType]]:
+        """(node, type) in graph order, read from the graph being built or from the CompactGraph."""
+        if self._graph is not None:
+            return [(node, data['type']) for node, data in self._graph.nodes(data=True)]
+        node_types = list(NodeType)
+        return [(tuple(box), node_types[code]) for box, code in zip(self._compact.bounding_boxes.tolist(), self._compact.node_types.tolist())]
+
+    def _find_road_end_pairs(self, road_end_nodes=None):
+        """Same pairs as _find_road_end_pairs_reference, keyed on node extents instead of a pairwise search.
 
-        self._create_intersection_nodes(intersection_corners)
-        self._create_end_of_road_nodes(end_of_road_corners)
+        The road-end nodes are read from the graph unless given, in graph order.
+        """
+        if self._engine == Engine.REFERENCE:
+            return self._find_road_end_pairs_reference()
 
+        if road_end_nodes is None:
+            road_end_nodes = [node for node, node_type in self._typed_nodes() if node_type == NodeType.ROAD_END]
+        position = {node: pos for pos, node in enumerate(road_end_nodes)}
+        # The reference pairs a node with the first unused node after it sharing the row extent
+        # ("vertical") or the column extent ("horizontal"), so one queue per extent is enough.
+        queues = ({}, {})
+        for node in road_end_nodes:
+            queues[0].setdefault((node[0], node[2]), deque()).append(node)
+            queues[1].setdefault((node[1], node[3]), deque()).append(node)
 
-    def _find_road_end_pairs(self):
+        used_nodes = set()
+        road_end_pairs = []
+        for node in road_end_nodes:
+            if node in used_nodes:
+                continue
+            used_nodes.add(node)
+
+            candidates = []
+            for queue in (queues[0][(node[0], node[2])], queues[1][(node[1], node[3])]):
+                while queue and queue[0] in used_nodes:
+                    queue.popleft()
+                candidates.append(queue[0] if queue else None)
+            same_rows, same_columns = candidates
+            if same_rows is None and same_columns is None:
+                continue
+
+            if same_columns is None or (same_rows is not None and position[same_rows] < position[same_columns]):
+                other, direction, at_start = same_rows, "vertical", node[3] == 0
+            else:
+                other, direction, at_start = same_columns, "horizontal", node[2] == 0
+            road_end_pairs.append({"pair": (node, other) if at_start else (other, node), "direction": direction})
+            used_nodes.add(other)
+
+        return road_end_pairs
+
+    def _find_road_end_pairs_reference(self):
         road_end_nodes = [node for node, data in self._graph.nodes(data=True) if data['type'] == NodeType.ROAD_END]
         used_nodes = set()
         road_end_pairs = []
@@ -217,13 +676,94 @@ class GridGraph:
         return bounding_box[0] <= point[0] <= bounding_box[2] and bounding_box[1] <= point[1] <= bounding_box[3]
 
 
-    def _connect_nodes_in_road(self, pair, direction):
+    def _build_adjacency_index(self):
+        """Per-row and per-column lists of the buildings and intersections covering each line.
+
+        Every entry is (first cell along the line, rank, node), where the rank is the graph
+        position, and lists are sorted, so a road sweep meets each node at its first cell, in the
+        reference's visiting order. Only the incremental updates and label_raster() use it; a
+        build finds the same chains with _road_edge_arrays.
+        """
+        index = {NodeType.BUILDING: ({}, {}), NodeType.INTERSECTION: ({}, {})}
+        nodes = self._typed_nodes()
+        self._next_rank = len(nodes)
+        for position, (node, node_type) in enumerate(nodes):
+            if node_type in (NodeType.BUILDING, NodeType.WAREHOUSE):
+                self._index_node(index[NodeType.BUILDING], node, position)
+            elif node_type == NodeType.INTERSECTION:
+                self._index_node(index[NodeType.INTERSECTION], node, position)
+
+        for lines in index.values():
+            for by_line in lines:
+                for entries in by_line.values():
+                    entries.sort()
+        return index
+
+    @staticmethod
+    def _index_node(lines, node, rank, insert=False):
+        by_row, by_column = lines
+        min_x, min_y, max_x, max_y = node
+        for by_line, first, line_range in ((by_row, min_y, range(min_x, max_x + 1)), (by_column, min_x, range(min_y, max_y + 1))):
+            for line in line_range:
+                entries = by_line.setdefault(line, [])
+                if insert:
+                    bisect.insort(entries, (first, rank, node))
+                else:
+                    entries.append((first, rank, node))
+
+    @staticmethod
+    def _unindex_node(lines, node):
+        by_row, by_column = lines
+        min_x, min_y, max_x, max_y = node
+        for by_line, line_range in ((by_row, range(min_x, max_x + 1)), (by_column, range(min_y, max_y + 1))):
+            for line in line_range:
+                by_line[line] = [entry for entry in by_line[line] if entry[2] != node]
+
+    def _road_lines(self, pair, direction):
+        """Axis swept, sweep length, side lines, own line and width of the road between a pair."""
+        # Same sweeps as the reference: a "horizontal" pair walks a column over range(cols)
+        # and a "vertical" pair walks a row over range(rows).
+        if direction == "horizontal":
+            start = min(pair[0][1], pair[1][1])
+            end = max(pair[0][3], pair[1][3])
+            return 1, self._cols, (end + 1, start - 1), start, end - start + 1
+        start = min(pair[0][0], pair[1][0])
+        end = max(pair[0][2], pair[1][2])
+        return 0, self._rows, (start - 1, end + 1), start, end - start + 1
+
+    def _road_chain(self, pair, direction):
+        """Nodes met along the road between a pair, in the order the reference links them."""
+        axis, length, sides, start, _ = self._road_lines(pair, direction)
+
+        # Within one step the reference visits buildings before intersections, each in graph order.
+        hits = {}
+        tests = 0
+        for kind, lines in ((NodeType.BUILDING, sides), (NodeType.INTERSECTION, (start,))):
+            by_line = self._adjacency_index[kind][axis]
+            order = 0 if kind == NodeType.BUILDING else 1
+            for line in lines:
+                for first, rank, node in by_line.get(line, ()):
+                    tests += 1
+                    if first >= length:
+                        break
+                    hits.setdefault((first, order, rank), [node, 0])[1] += 1
+        self._stats.count("bounding_box_tests", tests)
+
+        chain = [pair[0]]
+        for key in sorted(hits):
+            node, count = hits[key]
+            chain.extend([node] * count)
+        chain.append(pair[1])
+        return chain
+
+    def _connect_nodes_in_road_reference(self, pair, direction):
         #TODO: Make sure every node is used.
         used_nodes = set()
         building_nodes = [node for node, data in self._graph.nodes(data=True) if data['type'] == NodeType.BUILDING or data['type'] == NodeType.WAREHOUSE]
         intersection_nodes = [node for node, data in self._graph.nodes(data=True) if data['type'] == NodeType.INTERSECTION]
         current_node = pair[0]
         used_nodes.add(current_node)
+        tests = 0
 
         if direction == "horizontal":
             start_y = min(pair[0][1], pair[1][1])
@@ -236,6 +776,7 @@ class GridGraph:
                 for building in building_nodes:
                     if building in used_nodes:
                         continue
+                    tests += 2
                     if self._check_point_in_bounding_box(top, building):
                         self._graph.add_edge(current_node, building, weight=width)
                         used_nodes.add(building)
@@ -248,6 +789,7 @@ class GridGraph:
                 for intersection in intersection_nodes:
                     if intersection in used_nodes:
                         continue
+                    tests += 1
                     if self._check_point_in_bounding_box((x, start_y), intersection):
                         self._graph.add_edge(current_node, intersection, weight=width)
                         used_nodes.add(intersection)
@@ -266,6 +808,7 @@ class GridGraph:
                 for building in building_nodes:
                     if building in used_nodes:
                         continue
+                    tests += 2
                     if self._check_point_in_bounding_box(left, building):
                         self._graph.add_edge(current_node, building, weight=width)
                         used_nodes.add(building)
@@ -278,56 +821,509 @@ class GridGraph:
                 for intersection in intersection_nodes:
                     if intersection in used_nodes:
                         continue
+                    tests += 1
                     if self._check_point_in_bounding_box((start_x, y), intersection):
                         self._graph.add_edge(current_node, intersection, weight=width)
                         used_nodes.add(intersection)
                         current_node = intersection
             
             self._graph.add_edge(current_node, pair[1], weight=width)
+
+        # Every node marked used after the first one, and the far end, took one add_edge.
+        self._stats.count("edges_added", len(used_nodes))
+        self._stats.count("bounding_box_tests", tests)
     
-    def _create_edges(self):
-        road_end_pairs = self._find_road_end_pairs()
-        
-        for pair in road_end_pairs:
-            self._connect_nodes_in_road(pair["pair"], pair["direction"])
+    def _road_edge_arrays(self, boxes, types, road_end_pairs, node_of) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sources, targets and weights of the edges along every road, in the order the reference links them.
+
+        A road meets the buildings covering its side lines and the intersections covering its own
+        line, ordered as in _road_chain. Only the lines some road runs along are searched, by
+        bisecting each node's extent into them, so nothing is indexed per row or column.
+        """
+        codes = {node_type: code for code, node_type in enumerate(NodeType)}
+        kinds = ((np.flatnonzero((types == codes[NodeType.BUILDING]) | (types == codes[NodeType.WAREHOUSE])), 0),
+                 (np.flatnonzero(types == codes[NodeType.INTERSECTION]), 1))
+        roads = [self._road_lines(pair["pair"], pair["direction"]) for pair in road_end_pairs]
+        lengths = np.array([length for _, length, _, _, _ in roads], dtype=np.int64)
+        entries = []
+        for axis in (0, 1):
+            for nodes, order in kinds:
+                lines = [(line, road) for road, (road_axis, _, sides, start, _) in enumerate(roads) if road_axis == axis
+                         for line in (sides if order == 0 else (start,))]
+                if not lines or not len(nodes):
+                    continue
+                lines = np.array(sorted(lines), dtype=np.int64).reshape(-1, 2)
+                # As in _index_node: a node covers the lines of its extent across them and is met at its first cell along them.
+                begin = np.searchsorted(lines[:, 0], boxes[nodes, axis], "left")
+                counts = np.searchsorted(lines[:, 0], boxes[nodes, axis + 2], "right") - begin
+                self._stats.count("bounding_box_tests", int(counts.sum()))
+                # Every road along this axis sweeps the same length, so nodes starting past it are
+                # dropped before their (node, line) entries are laid out.
+                met = boxes[nodes, 1 - axis] < lengths[lines[0, 1]]
+                nodes, begin, counts = nodes[met], begin[met], counts[met]
+                offsets = np.cumsum(counts) - counts
+                query = np.repeat(begin - offsets, counts) + np.arange(counts.sum())
+                node = np.repeat(nodes, counts)
+                road = lines[query, 1]
+                entries.append((road, boxes[node, 1 - axis], np.full(len(node), order), node))
+        road, first, order, node = (np.concatenate(parts) for parts in zip(*entries)) if entries else (np.empty(0, dtype=np.int64),) * 4
+        sort = np.lexsort((node, order, first, road))
+        road, node = road[sort], node[sort]
+
+        # Every road's chain is its first end, the nodes it meets and its last end, laid out back to back.
+        per_road = np.bincount(road, minlength=len(roads))
+        starts = np.cumsum(per_road + 2) - (per_road + 2)
+        chain = np.empty(int(per_road.sum()) + 2 * len(roads), dtype=np.int64)
+        chain[starts] = [node_of[pair["pair"][0]] for pair in road_end_pairs]
+        chain[starts + per_road + 1] = [node_of[pair["pair"][1]] for pair in road_end_pairs]
+        chain[np.repeat(starts + 1 - (np.cumsum(per_road) - per_road), per_road) + np.arange(len(node))] = node
+        linked = np.ones(max(len(chain) - 1, 0), dtype=bool)
+        linked[starts[1:] - 1] = False
+        weights = np.repeat([width for _, _, _, _, width in roads], per_road + 2)[:-1][linked] if roads else np.empty(0, dtype=np.int64)
+        self._stats.count("edges_added", int(linked.sum()))
+        return chain[:-1][linked], chain[1:][linked], weights
+
+    def _graph_arrays(self) -> tuple[np.ndarray, ...]:
+        """Nodes and edges of the fast build, read from the grid one tile at a time into arrays.
+
+        Buildings come from one tiled pass over the grid and intersections from the tiled scan,
+        without a Python object per node; only road ends, which lie on the grid border, are
+        grouped and paired as Python objects. Returns bounding boxes, type codes and building IDs
+        in the order the reference adds the nodes, and sources, targets and weights with each
+        edge once, from its lesser bounding box, in the order the reference first links it.
+        """
+        stats = self._stats
+        with stats.phase("building_nodes"):
+            building_ids, building_boxes = self._building_extents()
+        stats.count("building_nodes", len(building_ids))
+        with stats.phase("corners"):
+            intersection_boxes, corner_count, end_of_road_corners, run_labels = self._scan_road_features()
+        stats.count("intersection_corners", corner_count)
+        stats.count("road_end_corners", len(end_of_road_corners))
+        stats.count("intersection_nodes", len(intersection_boxes))
+        with stats.phase("road_end_nodes"):
+            road_end_nodes = list(self._group_end_of_road_corners(end_of_road_corners, run_labels))
+        stats.count("road_end_nodes", len(road_end_nodes))
+
+        codes = {node_type: code for code, node_type in enumerate(NodeType)}
+        warehouse = np.isin(building_ids, list(self._grid.warehouses))
+        boxes = np.concatenate([building_boxes, intersection_boxes, np.array(road_end_nodes, dtype=np.int32).reshape(-1, 4)]).astype(np.int32)
+        types = np.concatenate([
+            np.where(warehouse, codes[NodeType.WAREHOUSE], codes[NodeType.BUILDING]),
+            np.full(len(intersection_boxes), codes[NodeType.INTERSECTION]),
+            np.full(len(road_end_nodes), codes[NodeType.ROAD_END]),
+        ]).astype(np.int8)
+        ids = np.concatenate([building_ids, np.full(len(intersection_boxes) + len(road_end_nodes), -1)]).astype(np.int32)
+        boxes, types, ids, merged = _merge_duplicate_nodes(boxes, types, ids)
+        first_road_end = len(building_ids) + len(intersection_boxes)
+        node_of = {node: int(merged[first_road_end + i]) if merged is not None else first_road_end + i for i, node in enumerate(road_end_nodes)}
+        if merged is not None:
+            # A merged node keeps only its last type, so the road ends are those still typed as one.
+            road_end_nodes = [tuple(box) for box in boxes[types == codes[NodeType.ROAD_END]].tolist()]
+
+        with stats.phase("road_end_pairs"):
+            self._road_end_pairs = self._find_road_end_pairs(road_end_nodes)
+        stats.count("road_end_pairs", len(self._road_end_pairs))
+        with stats.phase("road_edges"):
+            sources, targets, weights = self._road_edge_arrays(boxes, types, self._road_end_pairs, node_of)
+        with stats.phase("finalize"):
+            # Each edge from its lesser bounding box, like _edge_key.
+            rank = np.empty(len(boxes), dtype=np.int64)
+            rank[np.lexsort(boxes.T[::-1])] = np.arange(len(boxes))
+            swap = rank[sources] > rank[targets]
+            sources, targets = np.where(swap, targets, sources), np.where(swap, sources, targets)
+            return (boxes, types, ids, *_merge_edges(len(boxes), sources, targets, weights))
+
+    @staticmethod
+    def _networkx_from_arrays(boxes, types, ids, sources, targets, weights) -> "nx.Graph":
+        """An nx.Graph with the nodes and edges added in array order, so its adjacency order is the reference's."""
+        import networkx as nx
+
+        node_types = list(NodeType)
+        nodes = [tuple(box) for box in boxes.tolist()]
+        graph = nx.Graph()
+        graph.add_nodes_from(
+            (node, {'type': node_types[code], 'id': id} if id >= 0 else {'type': node_types[code]})
+            for node, code, id in zip(nodes, types.tolist(), ids.tolist())
+        )
+        graph.add_weighted_edges_from((nodes[u], nodes[v], w) for u, v, w in zip(sources.tolist(), targets.tolist(), weights.tolist()))
+        return graph
+
+    def _create_edges_reference(self):
+        stats = self._stats
+        with stats.phase("road_end_pairs"):
+            road_end_pairs = self._find_road_end_pairs()
+        stats.count("road_end_pairs", len(road_end_pairs))
+        self._road_end_pairs = road_end_pairs
+
+        with stats.phase("road_edges"):
+            for pair in road_end_pairs:
+                self._connect_nodes_in_road_reference(pair["pair"], pair["direction"])
 
         
     def create_graph(self):
-        self._find_building_nodes()
-        self._find_intersections_and_end_nodes()
-        self._create_edges()
+        """Build the graph from the grid; when instrumented, self.stats holds this build's stats."""
+        self.stats = BuildStats() if self._instrument else None
+        self._stats = stats = self.stats if self.stats is not None else DISABLED
+        with stats.phase("total"):
+            if self._engine == Engine.FAST:
+                # Arrays all the way, so a tiled build holds no per-node Python objects.
+                arrays = self._graph_arrays()
+                with stats.phase("finalize"):
+                    if self._backend == Backend.ARRAYS:
+                        self._compact = CompactGraph.from_edges(*arrays)
+                    else:
+                        self._graph = self._networkx_from_arrays(*arrays)
+            else:
+                # networkx is only imported here and by the networkx backend, so array-only workers skip it.
+                import networkx as nx
 
-    def get_graph(self):
+                self._graph = nx.Graph()
+                with stats.phase("building_nodes"):
+                    self._find_building_nodes_reference()
+                stats.count("building_nodes", self._graph.number_of_nodes())
+                self._find_intersections_and_end_nodes_reference()
+                self._create_edges_reference()
+
+                if self._backend == Backend.ARRAYS:
+                    with stats.phase("finalize"):
+                        self._compact = CompactGraph.from_networkx(self._graph)
+                    self._graph = None
+
+        self.version += 1
+        if self.stats is not None:
+            compact_or_graph = self._compact if self._compact is not None else self._graph
+            stats.count("nodes", compact_or_graph.number_of_nodes())
+            stats.count("edges", compact_or_graph.number_of_edges())
+        self._stats = DISABLED
+        if self._on_stats is not None:
+            self._on_stats(self.stats)
+
+    @property
+    def grid(self) -> Grid:
+        return self._grid
+
+    def get_graph(self) -> "nx.Graph":
+        """The graph as networkx; with the arrays backend a new copy is built on every call."""
+        if self._graph is None:
+            return self._compact.to_networkx()
         return self._graph
-    
-    def output_graphviz(self):
-        dot = Digraph()
-
-        color_map = {
-            NodeType.INTERSECTION: 'dodgerblue',
-            NodeType.ROAD_END: 'green3',
-            NodeType.BUILDING: 'gold',
-            NodeType.WAREHOUSE: 'firebrick1'  
+
+    def get_compact_graph(self) -> CompactGraph:
+        """The graph as a CompactGraph; with the networkx backend it is converted on every call."""
+        if self._compact is not None:
+            return self._compact
+        return CompactGraph.from_networkx(self._graph)
+
+    def _ensure_incremental_state(self):
+        """Build the bookkeeping needed by the incremental updates, once per graph."""
+        if self._edge_owners is not None:
+            return
+        if self._backend != Backend.NETWORKX:
+            raise ValueError("Incremental updates need the networkx backend.")
+        if self._adjacency_index is None:
+            self._adjacency_index = self._build_adjacency_index()
+        if self._road_chains is None:
+            self._road_chains = [self._road_chain(pair["pair"], pair["direction"]) for pair in self._road_end_pairs]
+
+        self._road_widths = []
+        self._pairs_by_line = {}
+        for i, pair in enumerate(self._road_end_pairs):
+            axis, _, sides, _, width = self._road_lines(pair["pair"], pair["direction"])
+            self._road_widths.append(width)
+            for line in sides:
+                self._pairs_by_line.setdefault((axis, line), []).append(i)
+
+        # Every edge remembers the roads that link it; like add_edge in a full build, the last
+        # of those roads sets its weight.
+        self._edge_owners = {}
+        for i, chain in enumerate(self._road_chains):
+            for u, v in zip(chain, chain[1:]):
+                self._edge_owners.setdefault(_edge_key(u, v), set()).add(i)
+
+        self._building_nodes = {
+            data['id']: node for node, data in self._graph.nodes(data=True)
+            if data['type'] in (NodeType.BUILDING, NodeType.WAREHOUSE)
         }
 
-        shape_map = {
-            NodeType.INTERSECTION: 'octagon',
-            NodeType.ROAD_END: 'square',
-            NodeType.BUILDING: 'house',
-            NodeType.WAREHOUSE: 'invhouse'
+    def _relink(self, bounding_box, changes: GraphChanges):
+        """Recompute the roads whose sides cross a bounding box and apply the edge differences."""
+        min_x, min_y, max_x, max_y = bounding_box
+        affected = set()
+        for axis, low, high in ((0, min_x, max_x), (1, min_y, max_y)):
+            for line in range(low, high + 1):
+                affected.update(self._pairs_by_line.get((axis, line), ()))
+
+        touched = set()
+        for i in sorted(affected):
+            pair = self._road_end_pairs[i]
+            old_chain = self._road_chains[i]
+            chain = self._road_chain(pair["pair"], pair["direction"])
+            if chain == old_chain:
+                continue
+            for u, v in zip(old_chain, old_chain[1:]):
+                key = _edge_key(u, v)
+                self._edge_owners[key].discard(i)
+                touched.add(key)
+            for u, v in zip(chain, chain[1:]):
+                key = _edge_key(u, v)
+                self._edge_owners.setdefault(key, set()).add(i)
+                touched.add(key)
+            self._road_chains[i] = chain
+
+        for key in touched:
+            owners = self._edge_owners.get(key)
+            if not owners:
+                self._edge_owners.pop(key, None)
+                if self._graph.has_edge(*key):
+                    self._graph.remove_edge(*key)
+                    changes.removed_edges.add(key)
+                continue
+            weight = self._road_widths[max(owners)]
+            if not self._graph.has_edge(*key):
+                self._graph.add_edge(*key, weight=weight)
+                changes.added_edges.add(key)
+            elif self._graph.edges[key]['weight'] != weight:
+                self._graph.edges[key]['weight'] = weight
+                changes.reweighted_edges.add(key)
+
+    def place_building(self, start_x: int, start_y: int, width: int, height: int, warehouse: bool = False) -> GraphChanges | None:
+        """Place a building on the grid (grid x/y coordinates) and add it to the graph.
+
+        Returns None if the placement is invalid, like Grid._place_building.
+        """
+        self._ensure_incremental_state()
+        building_id = self._grid.next_building_id
+        if not self._grid._place_building(start_x, start_y, width, height):
+            return None
+        if warehouse:
+            self._grid.warehouses.add(building_id)
+            self._warehouses.add(building_id)
+
+        node = (start_y, start_x, start_y + height - 1, start_x + width - 1)
+        self._graph.add_node(node, type=NodeType.WAREHOUSE if warehouse else NodeType.BUILDING, id=building_id)
+        self._building_nodes[building_id] = node
+        self._index_node(self._adjacency_index[NodeType.BUILDING], node, self._next_rank, insert=True)
+        self._next_rank += 1
+
+        changes = GraphChanges(added_nodes={node})
+        self._relink(node, changes)
+        self.version += 1
+        return changes
+
+    def remove_building(self, building_id: int) -> GraphChanges:
+        """Remove a building or warehouse from the grid and from the graph."""
+        self._ensure_incremental_state()
+        node = self._building_nodes.pop(building_id, None)
+        if node is None:
+            raise ValueError(f"There is no building with ID {building_id}.")
+        self._grid._remove_building(building_id)
+        self._warehouses.discard(building_id)
+
+        self._unindex_node(self._adjacency_index[NodeType.BUILDING], node)
+        changes = GraphChanges(removed_nodes={node})
+        self._relink(node, changes)
+        self._graph.remove_node(node)
+        self.version += 1
+        return changes
+
+    def update_warehouses(self) -> GraphChanges:
+        """Re-type the building nodes whose warehouse status changed in Grid.warehouses."""
+        self._ensure_incremental_state()
+        changes = GraphChanges()
+        for building_id in self._warehouses ^ self._grid.warehouses:
+            node = self._building_nodes.get(building_id)
+            if node is None:
+                continue
+            self._graph.nodes[node]['type'] = NodeType.WAREHOUSE if building_id in self._grid.warehouses else NodeType.BUILDING
+            changes.retyped_nodes.add(node)
+        self._warehouses = set(self._grid.warehouses)
+        if not changes.is_empty():
+            self.version += 1
+        return changes
+
+    def refresh(self) -> GraphChanges:
+        """Rebuild the whole graph after the layout changed, e.g. after Grid.reset."""
+        old_graph = self.get_graph()
+        self._reset_state()
+        self.create_graph()
+        return self._diff_graphs(old_graph, self.get_graph())
+
+    def diff_against_rebuild(self) -> GraphChanges:
+        """Differences from a full rebuild of the current grid; empty when the graph is consistent."""
+        return self._diff_graphs(self.get_graph(), GridGraph(self._grid, engine=self._engine).get_graph())
+
+    @staticmethod
+    def _diff_graphs(old: "nx.Graph", new: "nx.Graph") -> GraphChanges:
+        old_nodes, new_nodes = set(old.nodes), set(new.nodes)
+        old_edges = {_edge_key(u, v): data.get('weight') for u, v, data in old.edges(data=True)}
+        new_edges = {_edge_key(u, v): data.get('weight') for u, v, data in new.edges(data=True)}
+        return GraphChanges(
+            added_nodes=new_nodes - old_nodes,
+            removed_nodes=old_nodes - new_nodes,
+            retyped_nodes={node for node in old_nodes & new_nodes if old.nodes[node] != new.nodes[node]},
+            added_edges=new_edges.keys() - old_edges.keys(),
+            removed_edges=old_edges.keys() - new_edges.keys(),
+            reweighted_edges={key for key in old_edges.keys() & new_edges.keys() if old_edges[key] != new_edges[key]},
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Nodes and edges as plain arrays, nodes in graph order.
+
+        nodes: (N, 4) bounding boxes, node_types: index into list(NodeType), node_ids: building
+        ID or -1, edges: (E, 3) rows of (source index, target index, weight).
+        """
+        compact = self.get_compact_graph()
+        return {
+            "nodes": compact.bounding_boxes,
+            "node_types": compact.node_types,
+            "node_ids": compact.node_ids,
+            "edges": np.stack(compact.edge_arrays(), axis=1),
         }
 
-        for node in self._graph.nodes(data=True):
-            node_id, node_data = node
-            shape = shape_map.get(node_data['type'], 'square')
-            color = color_map.get(node_data['type'], 'gray')
-            label = f"{node_data['type']}({node_data['id']})\n{node_id}" if node_data['type'] in [NodeType.BUILDING, NodeType.WAREHOUSE] else f"{node_data['type']}\n{node_id}"
-            dot.node(str(node_id), label=label, shape=shape, style='filled', fillcolor=color)
-        for edge in self._graph.edges(data=True):
-            weight = edge[2].get('weight', 1)
-            dot.edge(str(edge[0]), str(edge[1]), label=str(weight), penwidth=str(weight), arrowhead='none')
-
-        dot.render('grid_graph', format='png')
+    def label_raster(self) -> np.ndarray:
+        """Grid-shaped array mapping every cell to the graph element on it.
+
+        A cell inside a node's bounding box holds the node's index (CompactGraph order, >= 0); a
+        road cell between two nodes holds -(edge index + 2), with edges in edge_arrays() order;
+        any other cell holds -1. Built on the first call and rebuilt after the graph changes.
+        """
+        if self._label_raster is not None and self._label_raster[0] == self.version:
+            return self._label_raster[1]
+
+        compact = self.get_compact_graph()
+        node_count = compact.number_of_nodes()
+        sources, targets, _ = compact.edge_arrays()
+        dtype = np.int32 if node_count + len(sources) + 2 < np.iinfo(np.int32).max else np.int64
+        raster = np.full((self._rows, self._cols), -1, dtype=dtype)
+        boxes = [tuple(box) for box in compact.bounding_boxes.tolist()]
+        node_index = {box: i for i, box in enumerate(boxes)}
+        edge_keys = sources.astype(np.int64) * node_count + targets
+        edge_order = np.argsort(edge_keys)
+
+        if not self._road_end_pairs and self._graph is None:
+            # A loaded graph keeps no build state; the pairs only depend on the nodes.
+            self._road_end_pairs = self._find_road_end_pairs()
+        chains = self._road_chains
+        if chains is None or len(chains) != len(self._road_end_pairs):
+            had_index = self._adjacency_index is not None
+            if not had_index:
+                self._adjacency_index = self._build_adjacency_index()
+            chains = [self._road_chain(pair["pair"], pair["direction"]) for pair in self._road_end_pairs]
+            if not had_index:
+                self._adjacency_index = None
+
+        # Each road is split at the first cell of every node met along it, and every piece is
+        # labelled with the edge from the node before the split to the node after it.
+        for pair, chain in zip(self._road_end_pairs, chains):
+            axis, _, _, start, width = self._road_lines(pair["pair"], pair["direction"])
+            length = raster.shape[1 - axis]
+            ends = [node[1 - axis] for node in chain[1:-1]] + [length]
+            splits = np.minimum(np.maximum.accumulate(np.array([0] + ends, dtype=np.int64)), length)
+            u = np.array([node_index[node] for node in chain[:-1]], dtype=np.int64)
+            v = np.array([node_index[node] for node in chain[1:]], dtype=np.int64)
+            keys = np.minimum(u, v) * node_count + np.maximum(u, v)
+            edges = edge_order[np.searchsorted(edge_keys, keys, sorter=edge_order)]
+            labels = np.repeat(-(edges + 2), np.diff(splits))
+            # Only the road cells of the band: the pairing can also match ends of different roads.
+            if axis == 0:
+                band, labels = (slice(start, start + width), slice(None)), labels[None, :]
+            else:
+                band, labels = (slice(None), slice(start, start + width)), labels[:, None]
+            road = np.asarray(self._matrix[band]) == CellType.ROAD
+            raster[band][road] = np.broadcast_to(labels, road.shape)[road]
+
+        # Buildings are labelled cell by cell from the grid, road features by bounding box.
+        building_node = np.full(max(self._grid.next_building_id, int(compact.node_ids.max(initial=0)) + 1), -1, dtype=dtype)
+        is_building = compact.node_ids >= 0
+        building_node[compact.node_ids[is_building]] = np.flatnonzero(is_building)
+        for top, left, bottom, right in self._tile_bounds():
+            tile = np.asarray(self._matrix[top:bottom, left:right])
+            cells = tile >= 1
+            raster[top:bottom, left:right][cells] = building_node[tile[cells]]
+        for i in np.flatnonzero(~is_building).tolist():
+            min_x, min_y, max_x, max_y = boxes[i]
+            raster[min_x:max_x + 1, min_y:max_y + 1] = i
+
+        self._label_raster = (self.version, raster)
+        return raster
+
+    @staticmethod
+    def decode_labels(labels) -> tuple[np.ndarray, np.ndarray]:
+        """Split label_raster() values into node indices and edge indices, -1 where not applicable."""
+        labels = np.asarray(labels)
+        return np.where(labels >= 0, labels, -1), np.where(labels <= -2, -labels - 2, -1)
+
+    def lookup_cells(self, x, y) -> np.ndarray:
+        """label_raster() values at grid cells (x, y) = (row, column), given as arrays; -1 off the grid."""
+        raster = self.label_raster()
+        x, y = np.asarray(x), np.asarray(y)
+        inside = (x >= 0) & (x < self._rows) & (y >= 0) & (y < self._cols)
+        return np.where(inside, raster[np.where(inside, x, 0), np.where(inside, y, 0)], -1)
+
+    def nearest_node_raster(self) -> np.ndarray:
+        """Grid-shaped array with the index of the closest node to each cell (4-neighbour steps), -1 if the graph has none."""
+        if self._nearest_node_raster is not None and self._nearest_node_raster[0] == self.version:
+            return self._nearest_node_raster[1]
+
+        # Node cells grow into their unlabelled neighbours one step at a time, which is a
+        # breadth-first search from all the nodes at once.
+        labels = self.label_raster()
+        nearest = np.where(labels >= 0, labels, -1)
+        unlabelled = nearest < 0
+        while unlabelled.any():
+            grown = nearest.copy()
+            for source, target in (((slice(None, -1), slice(None)), (slice(1, None), slice(None))),
+                                   ((slice(1, None), slice(None)), (slice(None, -1), slice(None))),
+                                   ((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                                   ((slice(None), slice(1, None)), (slice(None), slice(None, -1)))):
+                take = (grown[target] < 0) & (nearest[source] >= 0)
+                grown[target][take] = nearest[source][take]
+            if (grown == nearest).all():
+                break
+            nearest = grown
+            unlabelled = nearest < 0
+
+        self._nearest_node_raster = (self.version, nearest)
+        return nearest
+
+    def nearest_nodes(self, x, y) -> np.ndarray:
+        """Index of the closest node to each cell (x, y) = (row, column); points off the grid are clamped onto it."""
+        nearest = self.nearest_node_raster()
+        return nearest[np.clip(x, 0, self._rows - 1), np.clip(y, 0, self._cols - 1)]
+
+    _COMPACT_ARRAYS = ("bounding_boxes", "node_types", "node_ids", "indptr", "indices", "weights")
+
+    def save(self, path: str):
+        """Save the graph's CompactGraph arrays to a directory of .npy files."""
+        os.makedirs(path, exist_ok=True)
+        compact = self.get_compact_graph()
+        for name in self._COMPACT_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(compact, name))
+
+    @classmethod
+    def load(cls, path: str, grid: Grid, mmap_mode: str | None = 'r') -> "GridGraph":
+        """Load a graph saved with save() for `grid`, with the arrays backend and memory-mapped arrays."""
+        graph = cls.__new__(cls)
+        graph._setup(grid, Engine.FAST, Backend.ARRAYS, None)
+        graph._reset_state()
+        graph._graph = None
+        graph._compact = CompactGraph(*(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in cls._COMPACT_ARRAYS))
+        return graph
+
+    def output_graphviz(self, path: str = 'grid_graph', format: str = 'png', max_nodes: int | None = None) -> bool:
+        """Write the graph as DOT to `path` and render it to `path`.`format` with Graphviz.
+
+        Graphs with more than max_nodes nodes (export.MAX_RENDER_NODES by default) are only
+        written, since the layout would not finish; returns whether the image was rendered.
+        """
+        import export
+
+        # Converted once: with the networkx backend every get_compact_graph() call builds a new copy.
+        compact = self.get_compact_graph()
+        export.write_dot(compact, path)
+        max_nodes = export.MAX_RENDER_NODES if max_nodes is None else max_nodes
+        return export.render_dot(path, f"{path}.{format}", format, compact.number_of_nodes(), max_nodes)
 
 
 if __name__ == "__main__":
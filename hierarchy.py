@@ -0,0 +1,227 @@
+import heapq
+import os
+import numpy as np
+from grid_graph import GridGraph
+
+# Nodes a witness search may settle before giving up; giving up early only adds a shortcut that was not needed.
+WITNESS_SETTLE_LIMIT = 200
+
+
+def _witness_search(adjacency: list[dict], source: int, skipped: int, targets: dict[int, int], limit: int) -> dict[int, int]:
+    """Distances from source that avoid the node being contracted, searched no further than limit."""
+    distance = {source: 0}
+    heap = [(0, source)]
+    settled = 0
+    remaining = len(targets)
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > distance[u]:
+            continue
+        if d > limit or settled == WITNESS_SETTLE_LIMIT:
+            break
+        settled += 1
+        if u in targets:
+            remaining -= 1
+            if not remaining:
+                break
+        for v, (weight, _) in adjacency[u].items():
+            candidate = d + weight
+            if v != skipped and candidate < distance.get(v, float("inf")):
+                distance[v] = candidate
+                heapq.heappush(heap, (candidate, v))
+    return distance
+
+
+def _shortcuts(adjacency: list[dict], node: int) -> list[tuple[int, int, int]]:
+    """(a, b, weight) shortcuts contracting node needs: pairs of neighbours with no path as short that avoids it."""
+    neighbours = list(adjacency[node].items())
+    shortcuts = []
+    for i, (a, (weight_a, _)) in enumerate(neighbours[:-1]):
+        targets = {b: weight_a + weight_b for b, (weight_b, _) in neighbours[i + 1:]}
+        distance = _witness_search(adjacency, a, node, targets, max(targets.values()))
+        shortcuts.extend((a, b, via) for b, via in targets.items() if distance.get(b, float("inf")) > via)
+    return shortcuts
+
+
+class ContractionHierarchy:
+    """Contraction hierarchy over a GridGraph for fast point-to-point distances and paths.
+
+    Preprocessing contracts the nodes one at a time, least important first (by edge difference
+    plus contracted neighbours), adding a shortcut between two neighbours whenever the contracted
+    node was on their only shortest path. Only the upward edges, from each node to the higher
+    ranked ones, are kept, as CSR arrays with the contracted middle node of every shortcut (-1
+    for graph edges). A query runs Dijkstra upward from both ends and meets at the top, so it
+    settles a small part of the graph; paths are rebuilt by unpacking shortcuts.
+
+    The hierarchy is a snapshot: build a new one after changing the graph. save() and load()
+    store it as .npy files, like GridGraph.save(). Queries read the arrays directly, so a
+    memory-mapped hierarchy only pages in the rows a search visits.
+    """
+
+    _ARRAYS = ("bounding_boxes", "node_ids", "rank", "indptr", "indices", "weights", "middles")
+
+    def __init__(self, bounding_boxes, node_ids, rank, indptr, indices, weights, middles):
+        self.bounding_boxes = bounding_boxes
+        self.node_ids = node_ids
+        self.rank = rank
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.middles = middles
+        self._by_id = None
+
+    @classmethod
+    def build(cls, graph: GridGraph) -> "ContractionHierarchy":
+        """Contract every node of the graph and keep the resulting upward graph."""
+        compact = graph.get_compact_graph()
+        node_count = compact.number_of_nodes()
+        indptr, indices, weights = compact.indptr.tolist(), compact.indices.tolist(), compact.weights.tolist()
+        # Remaining graph as neighbour -> (weight, middle node); parallel edges keep the lightest.
+        adjacency = [{} for _ in range(node_count)]
+        for u in range(node_count):
+            for i in range(indptr[u], indptr[u + 1]):
+                v, weight = indices[i], weights[i]
+                if v != u and weight < adjacency[u].get(v, (float("inf"),))[0]:
+                    adjacency[u][v] = (weight, -1)
+
+        contracted_neighbours = [0] * node_count
+        heap = [(len(_shortcuts(adjacency, v)) - len(adjacency[v]), v) for v in range(node_count)]
+        heapq.heapify(heap)
+        rank = np.empty(node_count, dtype=np.int32)
+        upward = [None] * node_count
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            # Priorities go stale as neighbours are contracted: recompute and requeue if it is no longer the least.
+            shortcuts = _shortcuts(adjacency, v)
+            priority = len(shortcuts) - len(adjacency[v]) + contracted_neighbours[v]
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            rank[v] = order
+            order += 1
+            upward[v] = adjacency[v]
+            adjacency[v] = {}
+            for u in upward[v]:
+                del adjacency[u][v]
+                contracted_neighbours[u] += 1
+            for a, b, weight in shortcuts:
+                if weight < adjacency[a].get(b, (float("inf"),))[0]:
+                    adjacency[a][b] = adjacency[b][a] = (weight, v)
+
+        up_indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in upward], out=up_indptr[1:])
+        rows = [sorted(edges.items()) for edges in upward]
+        up_indices = np.array([v for row in rows for v, _ in row], dtype=np.int32)
+        up_weights = np.array([weight for row in rows for _, (weight, _) in row], dtype=np.int64)
+        middles = np.array([middle for row in rows for _, (_, middle) in row], dtype=np.int32)
+        return cls(compact.bounding_boxes, compact.node_ids, rank, up_indptr, up_indices, up_weights, middles)
+
+    def number_of_shortcuts(self) -> int:
+        return int((self.middles >= 0).sum())
+
+    def save(self, path: str):
+        """Save the hierarchy to a directory of .npy files."""
+        os.makedirs(path, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: str | None = 'r') -> "ContractionHierarchy":
+        """Load a hierarchy saved with save()."""
+        return cls(*(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in cls._ARRAYS))
+
+    def _search(self, source: int, target: int):
+        """Bidirectional upward Dijkstra: (distance, meeting node, forward parents, backward parents)."""
+        indptr, indices, weights = self.indptr, self.indices, self.weights
+        distances = ({source: 0}, {target: 0})
+        parents = ({source: None}, {target: None})
+        heaps = ([(0, source)], [(0, target)])
+        best, meeting = (0, source) if source == target else (float("inf"), -1)
+        while heaps[0] or heaps[1]:
+            for side in (0, 1):
+                heap, distance = heaps[side], distances[side]
+                if not heap:
+                    continue
+                d, u = heapq.heappop(heap)
+                if d >= best:
+                    # Everything left on this side is at least as far as the best meeting found.
+                    heap.clear()
+                    continue
+                if d > distance[u]:
+                    continue
+                other = distances[1 - side].get(u)
+                if other is not None and d + other < best:
+                    best, meeting = d + other, u
+                start, end = indptr[u:u + 2].tolist()
+                for i, v, weight in zip(range(start, end), indices[start:end].tolist(), weights[start:end].tolist()):
+                    candidate = d + weight
+                    if candidate < distance.get(v, float("inf")):
+                        distance[v] = candidate
+                        parents[side][v] = (u, i)
+                        heapq.heappush(heap, (candidate, v))
+        return best, meeting, parents[0], parents[1]
+
+    def _middle(self, lower: int, upper: int) -> int:
+        """Middle node of the upward edge from lower to upper."""
+        start, end = self.indptr[lower:lower + 2].tolist()
+        return int(self.middles[start + np.searchsorted(self.indices[start:end], upper)])
+
+    def _unpack(self, u: int, v: int, middle: int) -> list[int]:
+        """Graph nodes from u to v along an upward edge, excluding u."""
+        nodes = []
+        stack = [(u, v, middle)]
+        while stack:
+            a, b, middle = stack.pop()
+            if middle < 0:
+                nodes.append(b)
+                continue
+            # The middle node was contracted before both ends, so both halves are its upward edges.
+            stack.append((middle, b, self._middle(middle, b)))
+            stack.append((a, middle, self._middle(middle, a)))
+        return nodes
+
+    def _node(self, building_id: int) -> int:
+        if self._by_id is None:
+            # Node indices sorted by building ID and the sorted IDs, made on the first building query.
+            order = np.argsort(self.node_ids, kind="stable")
+            self._by_id = order, self.node_ids[order]
+        order, ids = self._by_id
+        position = int(np.searchsorted(ids, building_id))
+        if building_id < 0 or position == len(ids) or ids[position] != building_id:
+            raise ValueError(f"There is no building with ID {building_id}.")
+        return int(order[position])
+
+    def node_distance(self, source: int, target: int) -> float:
+        """Shortest distance between two nodes (CompactGraph indices), inf if unreachable."""
+        return self._search(source, target)[0]
+
+    def node_path(self, source: int, target: int) -> list[int]:
+        """Nodes (CompactGraph indices) of a shortest path from source to target; empty if unreachable."""
+        best, meeting, forward, backward = self._search(source, target)
+        if best == float("inf"):
+            return []
+        edges = []
+        node = meeting
+        while forward[node] is not None:
+            node, i = forward[node]
+            edges.append((node, int(self.indices[i]), int(self.middles[i])))
+        path = [source]
+        for u, v, middle in reversed(edges):
+            path.extend(self._unpack(u, v, middle))
+        node = meeting
+        while backward[node] is not None:
+            lower, i = backward[node]
+            path.extend(self._unpack(node, lower, int(self.middles[i])))
+            node = lower
+        return path
+
+    def distance(self, source_id: int, target_id: int) -> float:
+        """Shortest distance between two buildings, inf if unreachable."""
+        return self.node_distance(self._node(source_id), self._node(target_id))
+
+    def path(self, source_id: int, target_id: int) -> list[tuple[int, int, int, int]]:
+        """Bounding boxes of the nodes on a shortest path between two buildings; empty if unreachable."""
+        nodes = self.node_path(self._node(source_id), self._node(target_id))
+        return [tuple(box) for box in self.bounding_boxes[nodes].tolist()] if nodes else []
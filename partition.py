@@ -0,0 +1,187 @@
+import heapq
+import numpy as np
+from dataclasses import dataclass
+from grid_graph import GridGraph, NodeType
+
+
+@dataclass
+class ServiceArea:
+    warehouse_id: int
+    buildings: int
+    total_distance: int
+
+
+class ServiceAreas:
+    """Graph-Voronoi partition: every node labelled with its nearest warehouse and the distance to it.
+
+    A multi-source Dijkstra labels the whole graph; ties go to the lowest warehouse ID. Adding,
+    removing or moving a warehouse only re-runs Dijkstra over the nodes whose label can change:
+    the region the new warehouse wins, or the region the removed one served. Per-warehouse
+    building counts and total distances are kept up to date as labels change.
+
+    The warehouse set starts as Grid.warehouses but is the partition's own, so configurations can
+    be tried without touching the grid. A change to the graph itself (GridGraph.version) relabels
+    everything on the next call, dropping warehouses whose building is gone.
+    """
+
+    def __init__(self, graph: GridGraph, warehouses=None):
+        self._graph = graph
+        self._warehouses = set(graph.grid.warehouses if warehouses is None else warehouses)
+        self._version = None
+
+    def _refresh(self):
+        if self._graph.version == self._version:
+            return
+        compact = self._graph.get_compact_graph()
+        self._indptr, self._indices, self._weights = compact.indptr.tolist(), compact.indices.tolist(), compact.weights.tolist()
+        building_types = [list(NodeType).index(NodeType.BUILDING), list(NodeType).index(NodeType.WAREHOUSE)]
+        building = np.isin(compact.node_types, building_types)
+        self._node_ids = np.where(building, compact.node_ids, -1).tolist()
+        self._node_of = {id: node for node, id in enumerate(self._node_ids) if id >= 0}
+        # Warehouses whose building was removed from the graph stop being warehouses.
+        self._warehouses &= self._node_of.keys()
+        self._version = self._graph.version
+
+        count = len(self._node_ids)
+        self._distance = [float("inf")] * count
+        self._label = [-1] * count
+        self._members = {id: set() for id in self._warehouses}
+        self._buildings = dict.fromkeys(self._warehouses, 0)
+        self._total_distance = dict.fromkeys(self._warehouses, 0)
+        heap = []
+        for id in self._warehouses:
+            self._assign(self._node_of[id], 0, id)
+            heap.append((0, id, self._node_of[id]))
+        heapq.heapify(heap)
+        self._propagate(heap)
+
+    def _served(self, node) -> bool:
+        """Whether a node counts as a building served by its warehouse in the aggregates."""
+        id = self._node_ids[node]
+        return id >= 0 and id not in self._warehouses
+
+    def _unassign(self, node):
+        label = self._label[node]
+        if label < 0:
+            return
+        self._members[label].discard(node)
+        if self._served(node):
+            self._buildings[label] -= 1
+            self._total_distance[label] -= self._distance[node]
+        self._distance[node] = float("inf")
+        self._label[node] = -1
+
+    def _assign(self, node, distance, warehouse_id):
+        self._unassign(node)
+        self._distance[node] = distance
+        self._label[node] = warehouse_id
+        self._members[warehouse_id].add(node)
+        if self._served(node):
+            self._buildings[warehouse_id] += 1
+            self._total_distance[warehouse_id] += distance
+
+    def _propagate(self, heap, region=None):
+        """Dijkstra on (distance, warehouse ID) keys from the queued nodes, only into `region` if given."""
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        distance, label = self._distance, self._label
+        while heap:
+            d, id, u = heapq.heappop(heap)
+            if d != distance[u] or id != label[u]:
+                continue
+            for i in range(indptr[u], indptr[u + 1]):
+                v = indices[i]
+                if region is not None and v not in region:
+                    continue
+                candidate = d + weights[i]
+                if candidate < distance[v] or (candidate == distance[v] and id < label[v]):
+                    self._assign(v, candidate, id)
+                    heapq.heappush(heap, (candidate, id, v))
+
+    @property
+    def warehouses(self) -> frozenset[int]:
+        return frozenset(self._warehouses)
+
+    def add_warehouse(self, warehouse_id: int):
+        """Make a building a warehouse and relabel the nodes it is now nearest to."""
+        self._refresh()
+        if warehouse_id in self._warehouses:
+            return
+        node = self._node_of.get(warehouse_id)
+        if node is None:
+            raise ValueError(f"There is no building with ID {warehouse_id}.")
+        # Only nodes the new warehouse beats change label, and those are reached through each other.
+        self._unassign(node)
+        self._warehouses.add(warehouse_id)
+        self._members[warehouse_id] = set()
+        self._buildings[warehouse_id] = 0
+        self._total_distance[warehouse_id] = 0
+        self._assign(node, 0, warehouse_id)
+        self._propagate([(0, warehouse_id, node)])
+
+    def remove_warehouse(self, warehouse_id: int):
+        """Turn a warehouse back into a building and relabel the region it served."""
+        self._refresh()
+        if warehouse_id not in self._warehouses:
+            raise ValueError(f"Building {warehouse_id} is not a warehouse.")
+        region = set(self._members[warehouse_id])
+        for node in region:
+            self._unassign(node)
+        self._warehouses.discard(warehouse_id)
+        del self._members[warehouse_id], self._buildings[warehouse_id], self._total_distance[warehouse_id]
+
+        # The region is re-entered from its border with the other warehouses' areas.
+        heap = []
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        for v in region:
+            for i in range(indptr[v], indptr[v + 1]):
+                u = indices[i]
+                id = self._label[u]
+                if id < 0:
+                    continue
+                candidate = self._distance[u] + weights[i]
+                if candidate < self._distance[v] or (candidate == self._distance[v] and id < self._label[v]):
+                    self._assign(v, candidate, id)
+                    heap.append((candidate, id, v))
+        heapq.heapify(heap)
+        self._propagate(heap, region)
+
+    def move_warehouse(self, old_id: int, new_id: int):
+        """Move a warehouse from one building to another."""
+        self.remove_warehouse(old_id)
+        self.add_warehouse(new_id)
+
+    def set_warehouses(self, warehouse_ids):
+        """Switch to another warehouse set, applying only the differences."""
+        self._refresh()
+        warehouse_ids = set(warehouse_ids)
+        for id in sorted(self._warehouses - warehouse_ids):
+            self.remove_warehouse(id)
+        for id in sorted(warehouse_ids - self._warehouses):
+            self.add_warehouse(id)
+
+    def labels(self) -> np.ndarray:
+        """Nearest warehouse ID of every node in CompactGraph order, -1 when no warehouse is reachable."""
+        self._refresh()
+        return np.array(self._label, dtype=np.int64)
+
+    def distances(self) -> np.ndarray:
+        """Distance of every node to its nearest warehouse in CompactGraph order, inf when unreachable."""
+        self._refresh()
+        return np.array(self._distance, dtype=float)
+
+    def assignment(self, building_ids) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest warehouse ID (-1 if none) and distance for each of the given buildings."""
+        self._refresh()
+        nodes = []
+        for id in building_ids:
+            node = self._node_of.get(int(id))
+            if node is None:
+                raise ValueError(f"There is no building with ID {id}.")
+            nodes.append(node)
+        return (np.array([self._label[node] for node in nodes], dtype=np.int64),
+                np.array([self._distance[node] for node in nodes], dtype=float))
+
+    def aggregates(self) -> dict[int, ServiceArea]:
+        """Buildings served (warehouses excluded) and their total distance, per warehouse."""
+        self._refresh()
+        return {id: ServiceArea(id, self._buildings[id], self._total_distance[id]) for id in sorted(self._warehouses)}
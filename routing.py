@@ -0,0 +1,149 @@
+import heapq
+import numpy as np
+from grid_graph import GridGraph, NodeType
+
+
+def shortest_paths(indptr: list[int], indices: list[int], weights: list[int], source: int) -> tuple[list[float], list[int]]:
+    """Dijkstra from one node over CSR adjacency lists: distances (inf if unreachable) and predecessors (-1 at the source)."""
+    distance = [float("inf")] * (len(indptr) - 1)
+    predecessor = [-1] * (len(indptr) - 1)
+    distance[source] = 0
+    heap = [(0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > distance[u]:
+            continue
+        for i in range(indptr[u], indptr[u + 1]):
+            v = indices[i]
+            candidate = d + weights[i]
+            if candidate < distance[v]:
+                distance[v] = candidate
+                predecessor[v] = u
+                heapq.heappush(heap, (candidate, v))
+    return distance, predecessor
+
+
+class RoutingEngine:
+    """Warehouse-to-building shortest distances on a GridGraph, answered from a cache.
+
+    One Dijkstra run per warehouse fills a warehouse x building distance matrix and the
+    predecessors needed to rebuild paths. Before each query the cache is checked against
+    GridGraph.version and Grid.warehouses: a changed graph recomputes everything, a changed
+    warehouse set only runs (or drops) the warehouses that were added (or removed).
+    """
+
+    def __init__(self, graph: GridGraph):
+        self._graph = graph
+        self._version = None
+        self._rows = {}
+        self._warehouse_set = frozenset()
+
+    @property
+    def graph(self) -> GridGraph:
+        return self._graph
+
+    def _refresh(self):
+        graph = self._graph
+        if graph.version != self._version:
+            compact = graph.get_compact_graph()
+            self._nodes = [tuple(box) for box in compact.bounding_boxes.tolist()]
+            self._adjacency = compact.indptr.tolist(), compact.indices.tolist(), compact.weights.tolist()
+            building_types = [list(NodeType).index(NodeType.BUILDING), list(NodeType).index(NodeType.WAREHOUSE)]
+            building_nodes = np.flatnonzero(np.isin(compact.node_types, building_types))
+            order = np.argsort(compact.node_ids[building_nodes], kind="stable")
+            self._building_nodes = building_nodes[order]
+            self.building_ids = np.asarray(compact.node_ids[self._building_nodes], dtype=np.int64)
+            self._node_of = dict(zip(self.building_ids.tolist(), self._building_nodes.tolist()))
+            self._column = np.full(int(self.building_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+            self._column[self.building_ids] = np.arange(len(self.building_ids))
+            self._rows = {}
+            self._warehouse_set = None
+            self._version = graph.version
+
+        warehouses = frozenset(id for id in graph.grid.warehouses if id in self._node_of)
+        if warehouses == self._warehouse_set:
+            return
+        for id in self._rows.keys() - warehouses:
+            del self._rows[id]
+        for id in warehouses - self._rows.keys():
+            distance, predecessor = shortest_paths(*self._adjacency, self._node_of[id])
+            self._rows[id] = (np.asarray(distance)[self._building_nodes], np.asarray(predecessor, dtype=np.int32))
+
+        self.warehouse_ids = np.array(sorted(warehouses), dtype=np.int64)
+        self._warehouse_row = {id: row for row, id in enumerate(self.warehouse_ids.tolist())}
+        rows = [self._rows[id] for id in self.warehouse_ids.tolist()]
+        self._distances = np.stack([row[0] for row in rows]) if rows else np.empty((0, len(self.building_ids)))
+        self._warehouse_set = warehouses
+
+    def _columns(self, building_ids) -> np.ndarray:
+        if building_ids is None:
+            return np.arange(len(self.building_ids))
+        ids = np.asarray(building_ids, dtype=np.int64).reshape(-1)
+        known = (ids >= 0) & (ids < len(self._column))
+        columns = np.full(len(ids), -1, dtype=np.int64)
+        columns[known] = self._column[ids[known]]
+        if (columns < 0).any():
+            raise ValueError(f"There is no building with ID {int(ids[np.argmax(columns < 0)])}.")
+        return columns
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the cached distances and predecessors."""
+        return sum(distances.nbytes + predecessors.nbytes for distances, predecessors in self._rows.values())
+
+    def invalidate(self):
+        """Drop the cache, e.g. after changing the grid without going through GridGraph."""
+        self._version = None
+
+    def distances(self, building_ids=None) -> np.ndarray:
+        """(warehouses, buildings) distance matrix, rows in warehouse_ids order; all buildings by default."""
+        self._refresh()
+        return self._distances[:, self._columns(building_ids)]
+
+    def nearest_warehouse(self, building_ids=None) -> tuple[np.ndarray, np.ndarray]:
+        """Nearest warehouse ID and its distance for every building (-1 and inf when none is reachable).
+
+        Ties go to the lowest warehouse ID.
+        """
+        warehouses, distances = self.k_nearest_warehouses(building_ids, 1)
+        return warehouses[:, 0], distances[:, 0]
+
+    def k_nearest_warehouses(self, building_ids=None, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """(buildings, k) arrays of the k nearest warehouse IDs and distances, closest first, padded with -1 / inf."""
+        if k < 1:
+            raise ValueError("k must be at least 1.")
+        distances = self.distances(building_ids)
+        ids = np.full((distances.shape[1], k), -1, dtype=np.int64)
+        nearest = np.full((distances.shape[1], k), np.inf)
+        found = min(k, len(self.warehouse_ids))
+        if found:
+            order = np.argsort(distances, axis=0, kind="stable")[:found].T
+            nearest[:, :found] = np.take_along_axis(distances.T, order, axis=1)
+            ids[:, :found] = np.where(np.isfinite(nearest[:, :found]), self.warehouse_ids[order], -1)
+        return ids, nearest
+
+    def path(self, warehouse_id: int, building_id: int) -> list[tuple[int, int, int, int]]:
+        """Nodes of a shortest path from a warehouse to a building; empty if the building is unreachable."""
+        self._refresh()
+        if warehouse_id not in self._warehouse_row:
+            raise ValueError(f"Building {warehouse_id} is not a warehouse.")
+        node = int(self._building_nodes[self._columns([building_id])[0]])
+        predecessor = self._rows[warehouse_id][1]
+        source = self._node_of[warehouse_id]
+        path = [node]
+        while node != source:
+            node = int(predecessor[node])
+            if node < 0:
+                return []
+            path.append(node)
+        return [self._nodes[node] for node in reversed(path)]
+
+    def paths(self, warehouse_ids, building_ids) -> list[list[tuple[int, int, int, int]]]:
+        """path() for every (warehouse, building) pair."""
+        return [self.path(int(w), int(b)) for w, b in zip(warehouse_ids, building_ids)]
+
+    def nearest_paths(self, building_ids=None) -> list[list[tuple[int, int, int, int]]]:
+        """Path from each building's nearest warehouse to it (empty when none is reachable)."""
+        warehouses, _ = self.nearest_warehouse(building_ids)
+        ids = self.building_ids[self._columns(building_ids)]
+        return [self.path(int(w), int(b)) if w >= 0 else [] for w, b in zip(warehouses, ids)]
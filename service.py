@@ -0,0 +1,338 @@
+"""Local asyncio service that generates grids, builds their graphs and answers routing queries.
+
+    python service.py [--host 127.0.0.1] [--port 8765 | --unix PATH] [--workers N] [--max-megabytes M] [--max-cells C]
+                      [--max-routing-cells C] [--build-timeout SECONDS]
+
+Every endpoint is a GET taking the generation parameters as query arguments (width, height,
+seed and optionally max_road_width, min_building_size, max_building_size, engine):
+
+    /grid     cells and warehouses
+    /graph    nodes, node_types, node_ids and edges, as GridGraph.to_arrays()
+    /nearest  nearest warehouse and distance for `buildings` (comma-separated IDs; all if omitted)
+    /path     bounding boxes of the nodes on a shortest path from `warehouse` to `building`
+    /stats    cache statistics, as JSON
+
+Arrays are sent as an uncompressed .npz body, read with np.load(io.BytesIO(body)); errors are JSON.
+Grids larger than --max-cells are refused, so one request can't exhaust the memory; so are reference
+grids larger than MAX_REFERENCE_CELLS, and /nearest and /path on grids larger than --max-routing-cells,
+since the distance matrix grows with warehouses x nodes. Builds run in worker processes and give up
+after --build-timeout seconds.
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import signal
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from cache import GridCache
+from grid import Grid, Engine, check_layout_parameters
+from grid_graph import GridGraph, Backend
+from routing import RoutingEngine
+
+GRID_PARAMETERS = ("max_road_width", "min_building_size", "max_building_size")
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+MAX_CELLS = 4096 * 4096
+# The reference generator takes seconds at 512 x 512 and grows faster than the grid.
+MAX_REFERENCE_CELLS = 512 * 512
+# About 25 MB of distances and predecessors at 512 x 512, 375 MB at 1024 x 1024.
+MAX_ROUTING_CELLS = 512 * 512
+BUILD_TIMEOUT = 60.0
+
+
+def _timed(seconds: float, function, *args):
+    """function(*args) in a worker process, interrupted with TimeoutError after `seconds`."""
+    def give_up(signum, frame):
+        raise TimeoutError(f"Gave up after {seconds:g} s.")
+
+    signal.signal(signal.SIGALRM, give_up)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return function(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _build(params: dict) -> tuple[Grid, GridGraph]:
+    """Generate a grid and its graph; runs in a worker process."""
+    grid = Grid(params["width"], params["height"], seed=params["seed"], engine=params["engine"],
+                **{name: params[name] for name in GRID_PARAMETERS if name in params})
+    return grid, GridGraph(grid, backend=Backend.ARRAYS)
+
+
+def _build_routing(graph: GridGraph) -> RoutingEngine:
+    """A routing engine with its distance matrix computed; runs in a worker process."""
+    routing = RoutingEngine(graph)
+    routing.distances()
+    return routing
+
+
+def _parse_params(query: dict[str, list[str]], max_cells: int = MAX_CELLS) -> dict:
+    params = {}
+    try:
+        for name in ("width", "height", "seed") + GRID_PARAMETERS:
+            if name in query:
+                params[name] = int(query[name][0])
+        params["engine"] = Engine(query.get("engine", [Engine.FAST])[0])
+    except ValueError as error:
+        raise ValueError(f"Invalid parameter: {error}") from None
+    for name in ("width", "height", "seed"):
+        if name not in params:
+            raise ValueError(f"Missing parameter: {name}.")
+    check_layout_parameters(**{name: params[name] for name in ("width", "height") + GRID_PARAMETERS if name in params})
+    cells = params["width"] * params["height"]
+    if cells > max_cells:
+        raise ValueError(f"Grids are limited to {max_cells} cells.")
+    if params["engine"] == Engine.REFERENCE and cells > MAX_REFERENCE_CELLS:
+        raise ValueError(f"Reference grids are limited to {MAX_REFERENCE_CELLS} cells.")
+    return params
+
+
+def _error(status: int, message: str) -> tuple[int, str, bytes]:
+    return status, "application/json", json.dumps({"error": message}).encode()
+
+
+def encode_arrays(**arrays) -> bytes:
+    """The compact binary body used for every array response: an uncompressed .npz archive."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+@dataclass
+class _Entry:
+    grid: Grid
+    graph: GridGraph
+    routing: RoutingEngine | None = None
+
+    @property
+    def nbytes(self) -> int:
+        size = self.grid.grid.nbytes + self.graph.get_compact_graph().nbytes
+        return size + (self.routing.nbytes if self.routing is not None else 0)
+
+
+class GraphService:
+    """Process-pool backed builder with an LRU cache bounded in bytes and coalescing of identical requests."""
+
+    def __init__(self, workers: int | None = None, max_bytes: int = 1 << 30, max_cells: int = MAX_CELLS,
+                 max_routing_cells: int = MAX_ROUTING_CELLS, build_timeout: float = BUILD_TIMEOUT):
+        self._workers = workers
+        self._pool = self._new_pool()
+        self._max_bytes = max_bytes
+        self._max_cells = max_cells
+        self._max_routing_cells = max_routing_cells
+        self._build_timeout = build_timeout
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._routing_pending = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "pool_restarts": 0}
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Workers are not forked from the server: they would inherit its sockets and keep client connections open.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context(method))
+
+    async def entry(self, params: dict) -> _Entry:
+        """The cached grid and graph for these parameters, built at most once however many ask at the same time."""
+        key = GridCache.key(**params)
+        if key in self._entries:
+            self.counters["hits"] += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if key in self._pending:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            self._pending[key] = asyncio.ensure_future(self._build_entry(key, params))
+        # Shielded, so a client that disconnects does not cancel the build for the others.
+        return await asyncio.shield(self._pending[key])
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Swap a pool whose worker died (e.g. killed for using too much memory) for a new one."""
+        if self._pool is broken:
+            broken.shutdown(wait=False)
+            self._pool = self._new_pool()
+            self.counters["pool_restarts"] += 1
+
+    async def _run(self, function, *args):
+        """function(*args) in the pool, under the build timeout."""
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            future = loop.run_in_executor(pool, _timed, self._build_timeout, function, *args)
+        except BrokenProcessPool:
+            # Broken by an earlier job, so this one never ran and can go to a new pool.
+            self._replace_pool(pool)
+            pool = self._pool
+            future = loop.run_in_executor(pool, _timed, self._build_timeout, function, *args)
+        try:
+            return await future
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            raise
+
+    async def _build_entry(self, key: str, params: dict) -> _Entry:
+        try:
+            grid, graph = await self._run(_build, params)
+        finally:
+            del self._pending[key]
+        entry = self._entries[key] = _Entry(grid, graph)
+        self._evict()
+        return entry
+
+    async def routing(self, entry: _Entry) -> RoutingEngine:
+        """The entry's routing engine, with its distance matrix computed once, in the pool."""
+        if entry.routing is not None:
+            return entry.routing
+        key = id(entry)
+        if key in self._routing_pending:
+            self.counters["coalesced"] += 1
+        else:
+            self._routing_pending[key] = asyncio.ensure_future(self._build_routing(key, entry))
+        return await asyncio.shield(self._routing_pending[key])
+
+    async def _build_routing(self, key: int, entry: _Entry) -> RoutingEngine:
+        try:
+            engine = await self._run(_build_routing, entry.graph)
+        finally:
+            del self._routing_pending[key]
+        # The engine comes back with its own copy of the graph; keep that one only.
+        entry.graph, entry.grid, entry.routing = engine.graph, engine.graph.grid, engine
+        self._evict()
+        return engine
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits, always keeping the newest one."""
+        total = sum(entry.nbytes for entry in self._entries.values())
+        while total > self._max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.nbytes
+            self.counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self._entries), "bytes": sum(entry.nbytes for entry in self._entries.values()),
+                "max_bytes": self._max_bytes}
+
+    async def respond(self, path: str, query: dict[str, list[str]]) -> tuple[int, str, bytes]:
+        """(status, content type, body) for one request."""
+        if path == "/stats":
+            return 200, "application/json", json.dumps(self.stats()).encode()
+        if path not in ("/grid", "/graph", "/nearest", "/path"):
+            return _error(404, f"Unknown endpoint {path}.")
+
+        params = _parse_params(query, self._max_cells)
+        if path in ("/nearest", "/path") and params["width"] * params["height"] > self._max_routing_cells:
+            raise ValueError(f"Routing is limited to grids of {self._max_routing_cells} cells.")
+        entry = await self.entry(params)
+        if path == "/grid":
+            return 200, "application/octet-stream", encode_arrays(
+                cells=entry.grid.grid, warehouses=np.array(sorted(entry.grid.warehouses), dtype=np.int32))
+        if path == "/graph":
+            return 200, "application/octet-stream", encode_arrays(**entry.graph.to_arrays())
+
+        routing = await self.routing(entry)
+        if path == "/nearest":
+            buildings = None
+            if query.get("buildings", [""])[0]:
+                buildings = [int(id) for id in query["buildings"][0].split(",")]
+            warehouse_ids, distances = routing.nearest_warehouse(buildings)
+            building_ids = routing.building_ids if buildings is None else np.array(buildings, dtype=np.int64)
+            return 200, "application/octet-stream", encode_arrays(
+                building_ids=building_ids, warehouse_ids=warehouse_ids, distances=distances)
+        if "warehouse" not in query or "building" not in query:
+            raise ValueError("Missing parameter: warehouse and building are required.")
+        path_nodes = routing.path(int(query["warehouse"][0]), int(query["building"][0]))
+        return 200, "application/octet-stream", encode_arrays(nodes=np.array(path_nodes, dtype=np.int32).reshape(-1, 4))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.1: GET only, keep-alive until the client closes or asks to close."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                close = headers.get("connection", "").lower() == "close"
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    # The rest of a malformed request can't be framed, so the connection ends with it.
+                    status, content_type, body = _error(400, "Malformed request line.")
+                    close = True
+                elif parts[0] != "GET":
+                    status, content_type, body = _error(405, "Only GET is supported.")
+                else:
+                    status, content_type, body = await self._answer(parts[1])
+
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: {content_type}\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # ValueError: StreamReader.readline() got a line over the stream limit.
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, target: str) -> tuple[int, str, bytes]:
+        """respond() for a request target, with errors turned into 400 (bad input) or 500 responses."""
+        try:
+            url = urlsplit(target)
+            return await self.respond(url.path, parse_qs(url.query))
+        except ValueError as error:
+            return _error(400, str(error))
+        except TimeoutError as error:
+            return _error(503, str(error))
+        except Exception as error:
+            traceback.print_exc()
+            return _error(500, f"Internal error: {type(error).__name__}.")
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+async def serve(service: GraphService, host: str = "127.0.0.1", port: int = 8765, unix_path: str | None = None):
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle, unix_path)
+    else:
+        server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, help="build processes (default: all cores)")
+    parser.add_argument("--max-megabytes", type=int, default=1024, help="cache size before least recently used entries are evicted")
+    parser.add_argument("--max-cells", type=int, default=MAX_CELLS, help="largest grid (width x height) that will be generated")
+    parser.add_argument("--max-routing-cells", type=int, default=MAX_ROUTING_CELLS, help="largest grid /nearest and /path will route on")
+    parser.add_argument("--build-timeout", type=float, default=BUILD_TIMEOUT, help="seconds before a build is given up")
+    args = parser.parse_args()
+
+    service = GraphService(args.workers or os.cpu_count(), args.max_megabytes << 20, args.max_cells, args.max_routing_cells,
+                           args.build_timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""End-to-end checks of the local service over a Unix socket.
+
+    python service_check.py
+
+Identical concurrent requests share one build and match GridGraph.to_arrays(), the byte cap
+evicts, bad requests get the right statuses, and a build past the timeout gets a 503. Exits
+with status 1 if any check fails.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+from grid import Grid, Engine
+from grid_graph import GridGraph, Backend
+from service import GraphService, serve
+
+
+async def _get(path: str, target: str) -> tuple[int, dict]:
+    """Status and JSON (errors, /stats) or arrays of one GET to the service at a Unix socket."""
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(f"GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    if headers["content-type"] == "application/json":
+        return status, json.loads(body)
+    return status, dict(np.load(io.BytesIO(body)))
+
+
+async def _service_run(service: GraphService, requests) -> list[str]:
+    """Serve on a temporary Unix socket and run requests(get) against it."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "service.sock")
+        server = asyncio.ensure_future(serve(service, unix_path=path))
+        try:
+            while not os.path.exists(path):
+                await asyncio.sleep(0.01)
+            return await requests(lambda target: _get(path, target))
+        finally:
+            server.cancel()
+            service.close()
+
+
+def _service_errors() -> list[str]:
+    """Coalescing, eviction and error statuses of the service, on small grids."""
+    async def cached(get) -> list[str]:
+        errors = []
+        query = "width=40&height=30&seed=1"
+        responses = await asyncio.gather(*(get(f"/graph?{query}") for _ in range(3)))
+        expected = GridGraph(Grid(40, 30, seed=1, engine=Engine.FAST), backend=Backend.ARRAYS).to_arrays()
+        if any(status != 200 or any(not np.array_equal(arrays[name], expected[name]) for name in expected) for status, arrays in responses):
+            errors.append("service: /graph does not match GridGraph.to_arrays()")
+        _, stats = await get("/stats")
+        if (stats["misses"], stats["coalesced"]) != (1, 2):
+            errors.append(f"service: 3 identical requests gave {stats['misses']} builds and {stats['coalesced']} coalesced")
+        await get("/graph?width=30&height=40&seed=2")
+        _, stats = await get("/stats")
+        if (stats["entries"], stats["evictions"]) != (1, 1):
+            errors.append(f"service: a full cache kept {stats['entries']} entries after {stats['evictions']} evictions")
+
+        for target, expected_status in (
+            ("/graph?width=40&height=30", 400),
+            ("/graph?width=40&height=30&seed=x", 400),
+            ("/graph?width=50&height=50&seed=1&min_building_size=-3&max_building_size=-3&max_road_width=1", 400),
+            ("/graph?width=40&height=30&seed=1&max_road_width=0", 400),
+            ("/graph?width=5000&height=5000&seed=1", 400),
+            ("/graph?width=1000&height=1000&seed=1&engine=reference", 400),
+            ("/nearest?width=1000&height=1000&seed=1", 400),
+            (f"/nearest?{query}&buildings=100000", 400),
+            (f"/path?{query}&warehouse=1", 400),
+            ("/unknown", 404),
+        ):
+            status, _ = await get(target)
+            if status != expected_status:
+                errors.append(f"service: {target} gave {status}, expected {expected_status}")
+        return errors
+
+    async def slow(get) -> list[str]:
+        status, _ = await get("/graph?width=400&height=400&seed=1")
+        return [] if status == 503 else [f"service: a build past the timeout gave {status}, expected 503"]
+
+    return (asyncio.run(_service_run(GraphService(workers=1, max_bytes=1), cached))
+            + asyncio.run(_service_run(GraphService(workers=1, build_timeout=0.01), slow)))
+
+
+def main():
+    errors = _service_errors()
+    if errors:
+        print("FAIL service")
+        print("\n".join(f"  {error}" for error in errors))
+        sys.exit(1)
+    print("service checks passed")
+
+
+if __name__ == "__main__":
+    main()
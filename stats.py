@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+@dataclass
+class BuildStats:
+    """Phase timings (seconds) and counters collected while generating a grid or building a graph."""
+    timings: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a block, adding to any earlier time recorded under the same name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, amount: int = 1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def as_dict(self) -> dict[str, dict]:
+        return {"timings": dict(self.timings), "counts": dict(self.counts)}
+
+
+class _DisabledStats:
+    """Stand-in used when instrumentation is off, so instrumented code needs no checks."""
+    _context = nullcontext()
+
+    def phase(self, name: str):
+        return self._context
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+
+DISABLED = _DisabledStats()
+
+StatsCallback = Callable[[BuildStats], None]